@@ -0,0 +1,208 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numba
+import numpy as np
+from numba import njit
+
+import oddsfinder
+
+HAND = ['As', 'Kh']
+STREETS = {
+    'preflop': [],
+    'flop': ['Qs', '7h', '2d'],
+    'turn': ['Qs', '7h', '2d', '5c'],
+    'river': ['Qs', '7h', '2d', '5c', 'Jd'],
+}
+OPPONENTS = (1, 2, 3, 6, 9)
+DECKS = (1, 2)
+EXACT_MAX_STATES = 2_200_000_000  # Heads-up preflop from one deck is enumerated (about a minute)
+REFERENCE_SIMULATIONS = 2_000_000  # Stand-in for ground truth where enumeration is out of reach
+
+@njit
+def _evaluate_all(hands, five):
+    total = 0
+    for i in range(len(hands)):
+        if five:
+            total += oddsfinder.evaluate_5card(hands[i])
+        else:
+            total += oddsfinder.evaluate_7hand(hands[i])
+    return total
+
+def _percentiles(seconds):
+    ms = np.array(seconds) * 1000
+    return {
+        'mean_ms': float(ms.mean()),
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p95_ms': float(np.percentile(ms, 95)),
+        'p99_ms': float(np.percentile(ms, 99)),
+        'max_ms': float(ms.max()),
+    }
+
+def _measure(fn, repeats):
+    # Latencies of repeated calls plus the peak Python-heap allocation of one.
+    fn()
+    tracemalloc.start()
+    result = fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    seconds = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        seconds.append(time.perf_counter() - started)
+    return result, seconds, peak
+
+def bench_evaluators(n_hands=1_000_000, repeats=200, seed=0):
+    rng = np.random.default_rng(seed)
+    out = {}
+    for name, n_cards, fn in (('evaluate_5card', 5, oddsfinder.evaluate_5card),
+                              ('evaluate_7hand', 7, oddsfinder.evaluate_7hand)):
+        hands = np.array([rng.choice(52, n_cards, replace=False) for _ in range(n_hands)], dtype=np.uint8)
+        _evaluate_all(hands[:10], n_cards == 5)
+        started = time.perf_counter()
+        _evaluate_all(hands, n_cards == 5)
+        elapsed = time.perf_counter() - started
+        # Per-call latency from Python, dispatch overhead included.
+        _, seconds, peak = _measure(lambda: fn(hands[0]), repeats)
+        out[name] = dict(hands_per_second=n_hands / elapsed, peak_alloc_bytes=peak, **_percentiles(seconds))
+    return out
+
+def ground_truth(board, num_decks, max_states=EXACT_MAX_STATES, reference_simulations=REFERENCE_SIMULATIONS):
+    # Pairwise win/tie rates don't depend on the number of opponents, so one
+    # heads-up enumeration scores every opponent count.
+    started = time.perf_counter()
+    if oddsfinder.exact_state_count(board, num_decks) <= max_states:
+        win, tie = oddsfinder.exact_equity(HAND, board, num_decks)
+        exact, se = True, 0.0
+    else:
+        win, tie, _ = oddsfinder.simulate_equity(HAND, board, reference_simulations, num_decks,
+                                                 seed=12345, exact=False)
+        exact = False
+        se = 100 * np.sqrt(win / 100 * (1 - win / 100) / reference_simulations)
+    return {'win': float(win), 'tie': float(tie), 'exact': exact, 'se': float(se),
+            'seconds': time.perf_counter() - started}
+
+def _backends(simulations, pokerkit_simulations):
+    seeds = iter(range(1, 1 << 30))
+
+    def numba_mc(board, decks, opponents):
+        win, tie, _ = oddsfinder.simulate_equity(HAND, board, simulations, decks, opponents,
+                                                 seed=next(seeds), exact=False)
+        return win, tie, simulations
+
+    def pokerkit(board, decks, opponents):
+        win, tie = oddsfinder.calculate_win_percentage(HAND, board, pokerkit_simulations, decks, opponents)
+        return win, tie, pokerkit_simulations
+
+    def calculate_odds(board, decks, opponents):
+        win, tie = oddsfinder.calculate_odds(HAND, board, simulations, decks, opponents,
+                                             use_pokerkit=False, use_cache=False)
+        return win, tie, simulations
+
+    return {'monte_carlo_sim': numba_mc, 'calculate_win_percentage': pokerkit, 'calculate_odds': calculate_odds}
+
+def bench_backends(streets=STREETS, opponents=OPPONENTS, decks=DECKS, simulations=20000,
+                   pokerkit_simulations=2000, repeats=5, max_states=EXACT_MAX_STATES, backends=None):
+    truths = {}
+    results = []
+    available = _backends(simulations, pokerkit_simulations)
+    for name in backends or available:
+        backend = available[name]
+        for street, board in streets.items():
+            for num_decks in decks:
+                key = (street, num_decks)
+                if key not in truths:
+                    truths[key] = ground_truth(board, num_decks, max_states)
+                truth = truths[key]
+                for num_opponents in opponents:
+                    entry = {'backend': name, 'street': street, 'num_decks': num_decks,
+                             'num_opponents': num_opponents}
+                    try:
+                        (win, tie, sims), seconds, peak = _measure(
+                            lambda: backend(board, num_decks, num_opponents), repeats)
+                    except Exception as e:
+                        entry['error'] = f"{type(e).__name__}: {e}"
+                        results.append(entry)
+                        continue
+                    samples = sims * num_opponents
+                    p = truth['win'] / 100
+                    se = 100 * np.sqrt(max(p * (1 - p), 1e-12) / samples)
+                    entry.update(_percentiles(seconds))
+                    entry.update({
+                        'hands_per_second': samples / float(np.mean(seconds)),
+                        'peak_alloc_bytes': peak,
+                        'win': float(win),
+                        'tie': float(tie),
+                        'win_error': float(win - truth['win']),
+                        'tie_error': float(tie - truth['tie']),
+                        # Error in standard errors of the estimate, ground-truth noise included.
+                        'win_z': float((win - truth['win']) / np.hypot(se, truth['se'])),
+                    })
+                    results.append(entry)
+    ground = [dict(street=s, num_decks=d, **t) for (s, d), t in truths.items()]
+    return results, ground
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(output='bench_equity.json', quick=False, backends=None):
+    started = time.perf_counter()
+    oddsfinder.warmup()
+    if quick:
+        evaluators = bench_evaluators(n_hands=200_000, repeats=50)
+        results, ground = bench_backends(opponents=(1, 3, 9), simulations=5000, pokerkit_simulations=500,
+                                         repeats=3, max_states=50_000_000, backends=backends)
+    else:
+        evaluators = bench_evaluators()
+        results, ground = bench_backends(backends=backends)
+    report = {
+        'commit': _git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numba': numba.__version__,
+        'numpy': np.__version__,
+        'threads': numba.get_num_threads(),
+        'cpu_count': os.cpu_count(),
+        'quick': quick,
+        'hand': HAND,
+        'evaluators': evaluators,
+        'ground_truth': ground,
+        'backends': results,
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'seconds': time.perf_counter() - started,
+    }
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark and score the equity backends')
+    parser.add_argument('--output', default='bench_equity.json')
+    parser.add_argument('--quick', action='store_true', help='fewer spots and samples, no preflop enumeration')
+    parser.add_argument('--backend', action='append', dest='backends',
+                        choices=['monte_carlo_sim', 'calculate_win_percentage', 'calculate_odds'])
+    args = parser.parse_args()
+
+    report = run(args.output, args.quick, args.backends)
+    for name, stats in report['evaluators'].items():
+        print(f"{name}: {stats['hands_per_second'] / 1e6:.1f}M hands/s, p50 {stats['p50_ms'] * 1000:.1f}us per call")
+    for entry in report['backends']:
+        label = f"{entry['backend']:<24} {entry['street']:<7} decks={entry['num_decks']} opp={entry['num_opponents']}"
+        if 'error' in entry:
+            print(f"{label} error: {entry['error']}")
+        else:
+            print(f"{label} p50 {entry['p50_ms']:8.1f}ms  {entry['hands_per_second'] / 1e6:6.2f}M hands/s  "
+                  f"win err {entry['win_error']:+.2f} (z {entry['win_z']:+.1f})")
+    print(f"Wrote {args.output} in {report['seconds']:.0f}s")
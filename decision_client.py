@@ -0,0 +1,262 @@
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+
+import aiohttp
+
+import instrumentation
+
+OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+RETRY_STATUSES = {408, 409, 425, 429, 500, 502, 503, 504}
+NUMERIC_FIELDS = ('amount', 'confidence')  # Decision fields that must be numbers
+
+def fallback_action(win_prob, pot=0, to_call=0):
+    # Equity-only default used when the model can't answer in time.
+    if win_prob is None:
+        return {"action": "check" if to_call == 0 else "fold", "confidence": 50}
+    confidence = int(round(win_prob * 100))
+    if win_prob >= 0.65:
+        return {"action": "raise", "amount": max(int(pot * 0.5), to_call * 2), "confidence": confidence}
+    if to_call == 0:
+        return {"action": "check", "confidence": confidence}
+    if win_prob >= to_call / (pot + to_call):
+        return {"action": "call", "amount": to_call, "confidence": confidence}
+    return {"action": "fold", "confidence": confidence}
+
+class DecisionCache:
+    # LRU cache of model decisions keyed by a bucketed game-state signature.
+    # Entries expire after ttl seconds (wall clock, so persisted entries age
+    # across restarts). With a path, save() writes the cache as JSON and it is
+    # reloaded on construction.
+    def __init__(self, maxsize=4096, ttl=3600.0, path=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.path = path
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        if path is not None:
+            self.load()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] < time.time():
+                del self.entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return dict(entry[0])
+
+    def put(self, key, decision):
+        with self.lock:
+            self.entries[key] = (dict(decision), time.time() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'size': len(self.entries),
+                'evictions': self.evictions,
+            }
+
+    def save(self, path=None):
+        path = path or self.path
+        with self.lock:
+            now = time.time()
+            records = [[list(key), decision, expires]
+                       for key, (decision, expires) in self.entries.items() if expires > now]
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(records, f)
+        os.replace(tmp_path, path)
+
+    def load(self, path=None):
+        try:
+            with open(path or self.path) as f:
+                records = json.load(f)
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        with self.lock:
+            for key, decision, expires in records[-self.maxsize:]:
+                if expires > now:
+                    self.entries[_freeze(key)] = (decision, expires)
+
+def _freeze(value):
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+class DecisionClient:
+    # One pooled HTTP session shared by every table. Each request has a
+    # deadline covering queueing, retries and backoff; when it expires the
+    # caller's fallback is returned instead.
+    def __init__(self, api_key, model, url=OPENROUTER_URL, max_concurrency=8, pool_size=16,
+                 request_timeout=10.0, retries=2, backoff=0.25, temperature=0.7, max_tokens=150, cache=None):
+        self.api_key = api_key
+        self.model = model
+        self.url = url
+        self.max_concurrency = max_concurrency
+        self.pool_size = pool_size
+        self.request_timeout = request_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.cache = cache
+        self.inflight = {}
+        self.session = None
+        self.semaphore = None
+        self.stats = {'requests': 0, 'attempts': 0, 'retries': 0, 'errors': 0, 'fallbacks': 0, 'deduplicated': 0}
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    async def _ensure_session(self):
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=30)
+            self.session = aiohttp.ClientSession(connector=connector, headers={
+                "Authorization": f"Bearer {self.api_key}",
+                "Content-Type": "application/json"
+            })
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self.session
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def _post(self, session, prompt, timeout):
+        payload = {
+            "model": self.model,
+            "messages": [{
+                "role": "user",
+                "content": prompt
+            }],
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens
+        }
+        async with session.post(self.url, data=json.dumps(payload),
+                                timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+            if response.status != 200:
+                raise aiohttp.ClientResponseError(response.request_info, response.history,
+                                                  status=response.status)
+            response_data = await response.json(content_type=None)
+        decision = json.loads(response_data['choices'][0]['message']['content'])
+        if not isinstance(decision, dict) or 'action' not in decision:
+            raise ValueError(f"unexpected decision: {decision!r}")
+        # Numeric fields are logged and compared downstream; numbers sent as
+        # strings are converted, anything else ("pot", "65%") is malformed.
+        for field in NUMERIC_FIELDS:
+            value = decision.get(field)
+            if value is None or type(value) in (int, float):
+                continue
+            try:
+                if isinstance(value, bool):
+                    raise ValueError(value)
+                decision[field] = float(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"non-numeric {field} in decision: {decision!r}")
+        return decision
+
+    async def decide(self, prompt, budget=None, fallback=None, cache_key=None):
+        # budget is seconds from now; fallback is the action returned when the
+        # budget runs out or every attempt fails. With a cache_key, cached
+        # decisions are reused and identical requests already in flight are
+        # awaited instead of sent again. Fallbacks are never cached.
+        if cache_key is None:
+            return await self._decide(prompt, budget, fallback)
+        if self.cache is not None:
+            decision = self.cache.get(cache_key)
+            if decision is not None:
+                return decision
+        return await self._decide_shared(prompt, budget, fallback, cache_key)
+
+    async def _decide_shared(self, prompt, budget, fallback, cache_key):
+        task = self.inflight.get(cache_key)
+        if task is not None:
+            self.stats['deduplicated'] += 1
+            decision = await asyncio.shield(task)
+            return dict(decision)
+        task = asyncio.ensure_future(self._decide(prompt, budget, fallback))
+        self.inflight[cache_key] = task
+        try:
+            decision = await asyncio.shield(task)
+        finally:
+            self.inflight.pop(cache_key, None)
+        if self.cache is not None and not decision.get('fallback'):
+            self.cache.put(cache_key, decision)
+        return dict(decision)
+
+    async def _decide(self, prompt, budget, fallback):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (budget if budget is not None else self.request_timeout * (self.retries + 1))
+        fallback = dict(fallback or {"action": "check", "confidence": 50}, fallback=True)
+        session = await self._ensure_session()
+        self.stats['requests'] += 1
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), deadline - loop.time())
+        except asyncio.TimeoutError:
+            self.stats['fallbacks'] += 1
+            return fallback
+        try:
+            for attempt in range(self.retries + 1):
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                self.stats['attempts'] += 1
+                try:
+                    with instrumentation.timer('llm_request_seconds', 'HTTP round trips to the model'):
+                        return await self._post(session, prompt, min(remaining, self.request_timeout))
+                except aiohttp.ClientResponseError as e:
+                    self.stats['errors'] += 1
+                    if e.status not in RETRY_STATUSES:
+                        break
+                except (aiohttp.ClientError, asyncio.TimeoutError, KeyError, IndexError, TypeError, ValueError):
+                    self.stats['errors'] += 1
+                if attempt < self.retries:
+                    self.stats['retries'] += 1
+                    delay = self.backoff * 2 ** attempt * (0.5 + random.random())
+                    await asyncio.sleep(max(0.0, min(delay, deadline - loop.time())))
+        finally:
+            self.semaphore.release()
+        self.stats['fallbacks'] += 1
+        return fallback
+
+    def decide_blocking(self, prompt, budget=None, fallback=None, cache_key=None):
+        # For synchronous callers: runs decide on the client's own event loop
+        # thread, so blocking callers still share the pool. Cache hits are
+        # answered on the calling thread.
+        if cache_key is not None and self.cache is not None:
+            decision = self.cache.get(cache_key)
+            if decision is not None:
+                return decision
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name='decision-client', daemon=True)
+                self._thread.start()
+        if cache_key is None:
+            coro = self._decide(prompt, budget, fallback)
+        else:
+            coro = self._decide_shared(prompt, budget, fallback, cache_key)
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        return future.result()
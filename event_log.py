@@ -0,0 +1,270 @@
+import argparse
+import glob
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from hand_history import Hand
+from oddsfinder import card_to_index, index_to_card
+
+# Every event is one fixed-width little-endian record. Table and player
+# names are ids into the log's name table (<prefix>.names, one JSON string
+# per line, id = line number), so names of any length round-trip. Card slots
+# hold card indices, NO_CARD when empty.
+EVENT = np.dtype([
+    ('time', '<f8'),          # Unix time
+    ('table', '<u4'),         # Name id
+    ('hand', '<u4'),          # Hand number within the table's session
+    ('kind', 'u1'),
+    ('stage', 'u1'),          # Community cards on the board
+    ('action', 'u1'),         # Index into ACTIONS
+    ('flags', 'u1'),
+    ('player', '<u4'),        # Name id
+    ('amount', '<f8'),        # Chips added, the seat's stack, or the decision's amount
+    ('pot', '<f8'),
+    ('win', '<f4'),           # Equity results, as fractions
+    ('tie', '<f4'),
+    ('confidence', '<f4'),    # Decisions: model confidence (percent) and seconds taken
+    ('latency', '<f4'),
+    ('cards', 'u1', (7,)),    # Hole cards on HAND, the cards dealt on BOARD
+    ('_pad', 'u1'),
+])
+assert EVENT.itemsize == 64
+
+HAND, SEAT, ACTION, BOARD, EQUITY, DECISION = range(6)
+KINDS = ('hand', 'seat', 'action', 'board', 'equity', 'decision')
+ACTIONS = ('', 'fold', 'check', 'call', 'bet', 'raise', 'all-in', 'other')
+ACTION_CODE = {name: i for i, name in enumerate(ACTIONS)}
+FAST_PATH = 1  # DECISION flag: answered without the model
+NO_CARD = 255
+
+MAGIC = b'PGEVLOG1'
+HEADER = np.dtype([('magic', 'S8'), ('record_size', '<u4'), ('version', '<u4')])
+VERSION = 2
+MAX_FILE_BYTES = 64 << 20  # Segments rotate at this size
+BUFFER_RECORDS = 1024  # Events held in memory between writes
+
+NO_CARDS = (NO_CARD,) * 7
+
+def _cards(cards):
+    if not cards:
+        return NO_CARDS
+    out = [NO_CARD] * 7
+    for i, card in enumerate(cards[:7]):
+        out[i] = card_to_index(card)
+    return out
+
+class EventLog:
+    # Append-only log of table events in fixed-width binary records. Events
+    # go into a preallocated numpy buffer and reach disk one write() per
+    # BUFFER_RECORDS events (or on flush()). Files are segments named
+    # <prefix>.<n>.evl, each starting with a 16-byte header; a new one is
+    # opened once the current one would pass max_bytes. New names are
+    # appended to <prefix>.names before the records that use them. One log
+    # can be shared by every table in the process.
+    def __init__(self, prefix, max_bytes=MAX_FILE_BYTES, buffer_records=BUFFER_RECORDS):
+        self.prefix = prefix
+        self.max_bytes = max(max_bytes, HEADER.itemsize + EVENT.itemsize)
+        self.buffer = np.zeros(buffer_records, dtype=EVENT)
+        self.used = 0
+        self.lock = threading.Lock()
+        self.file = None
+        self.file_bytes = 0
+        self.records_written = 0
+        self.segment = max([_segment_number(path) for path in segments(prefix)], default=-1)
+        directory = os.path.dirname(prefix)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.names = {name: i for i, name in enumerate(read_names(prefix))}
+        self.new_names = []
+
+    def _name_id(self, name):
+        # Caller holds the lock.
+        name = str(name)
+        name_id = self.names.get(name)
+        if name_id is None:
+            name_id = self.names[name] = len(self.names)
+            self.new_names.append(name)
+        return name_id
+
+    def log(self, kind, table='', hand=0, stage=0, player='', action='', amount=0, pot=0,
+            win=0.0, tie=0.0, confidence=0.0, latency=0.0, cards=(), flags=0):
+        with self.lock:
+            if self.used == len(self.buffer):
+                self._write()
+            self.buffer[self.used] = (
+                time.time(), self._name_id(table), hand, kind, stage,
+                ACTION_CODE.get(action, ACTION_CODE['other']) if action else 0, flags, self._name_id(player),
+                amount or 0, pot or 0, win, tie, confidence or 0, latency, _cards(cards), 0,
+            )
+            self.used += 1
+
+    def _open_segment(self):
+        if self.file is not None:
+            self.file.close()
+        self.segment += 1
+        self.file = open(f"{self.prefix}.{self.segment:06d}.evl", 'wb')
+        header = np.zeros(1, dtype=HEADER)
+        header['magic'] = MAGIC
+        header['record_size'] = EVENT.itemsize
+        header['version'] = VERSION
+        self.file.write(header.tobytes())
+        self.file_bytes = HEADER.itemsize
+
+    def _write(self):
+        # Writes the buffered events, splitting them at segment boundaries.
+        # Caller holds the lock.
+        if self.new_names:
+            with open(f"{self.prefix}.names", 'a', encoding='utf-8') as f:
+                f.write(''.join(json.dumps(name) + '\n' for name in self.new_names))
+            self.new_names = []
+        start = 0
+        while start < self.used:
+            if self.file is None or self.file_bytes + EVENT.itemsize > self.max_bytes:
+                self._open_segment()
+            room = (self.max_bytes - self.file_bytes) // EVENT.itemsize
+            end = min(self.used, start + room)
+            self.file.write(memoryview(self.buffer[start:end]).cast('B'))
+            self.file_bytes += (end - start) * EVENT.itemsize
+            self.records_written += end - start
+            start = end
+        self.used = 0
+        if self.file is not None:
+            self.file.flush()
+
+    def flush(self):
+        with self.lock:
+            self._write()
+
+    def close(self):
+        with self.lock:
+            self._write()
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+def _segment_number(path):
+    return int(path.rsplit('.', 2)[-2])
+
+def segments(prefix):
+    # Segment files of a log in write order.
+    return sorted(glob.glob(glob.escape(prefix) + '.[0-9]*.evl'), key=_segment_number)
+
+def read_segment(path):
+    # Memory-maps one segment as a structured array of EVENT records. Nothing
+    # is copied until fields are read; a segment still being written shows
+    # the records flushed so far.
+    header = np.fromfile(path, dtype=HEADER, count=1)
+    if (len(header) == 0 or header['magic'][0] != MAGIC or header['record_size'][0] != EVENT.itemsize
+            or header['version'][0] != VERSION):
+        raise ValueError(f"{path} is not an event log segment")
+    records = (os.path.getsize(path) - HEADER.itemsize) // EVENT.itemsize
+    if records == 0:
+        return np.zeros(0, dtype=EVENT)
+    return np.memmap(path, dtype=EVENT, mode='r', offset=HEADER.itemsize, shape=(records,))
+
+def read_events(prefix):
+    # Every segment of a log, mapped in order.
+    return [read_segment(path) for path in segments(prefix)]
+
+def read_names(prefix):
+    # The name table: names[id] for the table and player fields.
+    try:
+        with open(f"{prefix}.names", encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+def decode(record, names):
+    # One record as a dict, for inspection.
+    event = {
+        'time': float(record['time']),
+        'kind': KINDS[record['kind']],
+        'table': names[record['table']],
+        'hand': int(record['hand']),
+        'stage': int(record['stage']),
+    }
+    kind = record['kind']
+    if kind in (SEAT, ACTION, DECISION):
+        event['player'] = names[record['player']]
+        event['amount'] = float(record['amount'])
+    if kind in (ACTION, DECISION):
+        event['action'] = ACTIONS[record['action']]
+    if kind in (HAND, BOARD):
+        event['cards'] = [index_to_card(int(c)) for c in record['cards'] if c != NO_CARD]
+    if kind in (HAND, ACTION, EQUITY, DECISION):
+        event['pot'] = float(record['pot'])
+    if kind == EQUITY:
+        event['win'] = float(record['win'])
+        event['tie'] = float(record['tie'])
+    if kind == DECISION:
+        event['confidence'] = float(record['confidence'])
+        event['latency'] = float(record['latency'])
+        event['fast_path'] = bool(record['flags'] & FAST_PATH)
+    return event
+
+def iter_hands(prefix):
+    # Rebuilds the logged hands as hand_history.Hand tuples for replay_hand.
+    # Equity and decision records are skipped. Hands still open when the log
+    # ends are yielded at the end.
+    names = read_names(prefix)
+    open_hands = {}
+    for records in read_events(prefix):
+        for record in records:
+            kind = record['kind']
+            table = int(record['table'])
+            hand_id = int(record['hand'])
+            if kind == HAND:
+                previous = open_hands.pop(table, None)
+                if previous is not None:
+                    yield previous
+                cards = [index_to_card(int(c)) for c in record['cards'] if c != NO_CARD]
+                open_hands[table] = Hand(names[table], hand_id, {}, cards, [])
+                continue
+            hand = open_hands.get(table)
+            if hand is None or hand.hand_id != hand_id:
+                continue
+            amount = float(record['amount'])
+            amount = int(amount) if amount.is_integer() else amount
+            if kind == SEAT:
+                hand.players[names[record['player']]] = amount
+            elif kind == BOARD:
+                hand.events.append(('board', [index_to_card(int(c)) for c in record['cards'] if c != NO_CARD]))
+            elif kind == ACTION:
+                hand.events.append(('action', names[record['player']],
+                                    {'type': ACTIONS[record['action']], 'amount': amount}))
+    yield from open_hands.values()
+
+def summary(prefix):
+    counts = np.zeros(len(KINDS), dtype=np.int64)
+    files = segments(prefix)
+    for records in read_events(prefix):
+        counts += np.bincount(records['kind'], minlength=len(KINDS))[:len(KINDS)]
+    return {
+        'segments': len(files),
+        'bytes': sum(os.path.getsize(path) for path in files),
+        'events': dict(zip(KINDS, counts.tolist())),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Inspect a binary event log')
+    commands = parser.add_subparsers(dest='command', required=True)
+    show = commands.add_parser('dump', help='print every event')
+    show.add_argument('prefix')
+    show.add_argument('--kind', choices=KINDS, default=None)
+    stats = commands.add_parser('summary', help='count events by kind')
+    stats.add_argument('prefix')
+    args = parser.parse_args()
+
+    if args.command == 'dump':
+        names = read_names(args.prefix)
+        for records in read_events(args.prefix):
+            if args.kind is not None:
+                records = records[records['kind'] == KINDS.index(args.kind)]
+            for record in records:
+                print(decode(record, names))
+    else:
+        print(summary(args.prefix))
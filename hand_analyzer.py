@@ -0,0 +1,248 @@
+import time
+from collections import namedtuple
+
+import numpy as np
+from numba import njit, prange
+
+from oddsfinder import KERNEL_LOCK, _live_deck, card_to_index, evaluate_7hand, index_to_card
+
+CATEGORY_NAMES = ('high card', 'pair', 'two pair', 'trips', 'straight', 'flush', 'full house', 'quads',
+                  'straight flush')
+HISTOGRAM_BINS = 10
+
+# Board texture lookups. STRAIGHT_WINDOW[mask] is the most board ranks (of a
+# 13-bit rank mask) that fit in one straight, the wheel included; three or
+# more means a straight is possible.
+_WINDOWS = [0x100f] + [0x1f << low for low in range(9)]
+STRAIGHT_WINDOW = np.array([max(bin(mask & w).count('1') for w in _WINDOWS) for mask in range(1 << 13)],
+                           dtype=np.uint8)
+RANK_MASK_BITS = np.array([bin(mask).count('1') for mask in range(1 << 13)], dtype=np.uint8)
+
+BoardTexture = namedtuple('BoardTexture', ['paired', 'trips', 'monotone', 'two_tone', 'rainbow',
+                                           'flush_possible', 'straight_possible', 'connectedness', 'high_card'])
+HandAnalysis = namedtuple('HandAnalysis', ['category', 'outs', 'next_street', 'river', 'equity',
+                                           'equity_histogram', 'texture'])
+
+def board_texture(community_cards):
+    cards = [card_to_index(c) for c in community_cards]
+    if not cards:
+        return None
+    mask = 0
+    rank_counts = [0] * 13
+    suit_counts = [0] * 4
+    for c in cards:
+        mask |= 1 << (c // 4)
+        rank_counts[c // 4] += 1
+        suit_counts[c % 4] += 1
+    max_suit = max(suit_counts)
+    return BoardTexture(
+        paired=int(RANK_MASK_BITS[mask]) < len(cards),
+        trips=max(rank_counts) >= 3,
+        monotone=len(cards) >= 3 and max_suit == len(cards),
+        two_tone=sum(1 for n in suit_counts if n) == 2,
+        rainbow=max_suit == 1,
+        flush_possible=max_suit >= 3,
+        straight_possible=int(STRAIGHT_WINDOW[mask]) >= 3,
+        connectedness=int(STRAIGHT_WINDOW[mask]),
+        high_card='23456789TJQKA'[mask.bit_length() - 1],
+    )
+
+@njit(cache=True)
+def _category_counts(known, deck, k):
+    # Final hand category of known plus every k-card combination of deck.
+    counts = np.zeros(9, dtype=np.float64)
+    n = len(deck)
+    n_known = len(known)
+    cards = np.empty(n_known + k, dtype=np.int32)
+    cards[:n_known] = known
+    idx = np.arange(k)
+    while True:
+        for j in range(k):
+            cards[n_known + j] = deck[idx[j]]
+        counts[evaluate_7hand(cards) >> 20] += 1
+        i = k - 1
+        while i >= 0 and idx[i] == n - k + i:
+            i -= 1
+        if i < 0:
+            break
+        idx[i] += 1
+        for j in range(i + 1, k):
+            idx[j] = idx[j - 1] + 1
+    return counts
+
+@njit(cache=True)
+def _next_card_categories(known, deck):
+    cards = np.empty(len(known) + 1, dtype=np.int32)
+    cards[:len(known)] = known
+    out = np.empty(len(deck), dtype=np.int64)
+    for i in range(len(deck)):
+        cards[len(known)] = deck[i]
+        out[i] = evaluate_7hand(cards) >> 20
+    return out
+
+@njit(parallel=True, nogil=True, cache=True)
+def _equity_vs_hands(player_hand, community, deck):
+    # Hero's exact equity (win + tie/2) against every opponent holding from
+    # deck, over all runouts of the remaining cards. Flop, turn or river only.
+    n = len(deck)
+    n_known = len(community)
+    k = 5 - n_known
+    hero = np.empty(7, dtype=np.int32)
+    hero[:2] = player_hand
+    hero[2:2 + n_known] = community
+    # Hero's strength on each runout, shared by every opponent holding.
+    hero_strength = np.zeros((n, n), dtype=np.int64)
+    if k == 0:
+        hero_strength[0, 0] = evaluate_7hand(hero)
+    elif k == 1:
+        for i in range(n):
+            hero[6] = deck[i]
+            hero_strength[i, i] = evaluate_7hand(hero)
+    else:
+        for i in range(n):
+            hero[5] = deck[i]
+            for j in range(i + 1, n):
+                hero[6] = deck[j]
+                hero_strength[i, j] = evaluate_7hand(hero)
+    n_pairs = n * (n - 1) // 2
+    first = np.empty(n_pairs, dtype=np.int64)
+    second = np.empty(n_pairs, dtype=np.int64)
+    p = 0
+    for a in range(n):
+        for b in range(a + 1, n):
+            first[p] = a
+            second[p] = b
+            p += 1
+    equities = np.empty(n_pairs, dtype=np.float64)
+    for p in prange(n_pairs):
+        a = first[p]
+        b = second[p]
+        opp = np.empty(7, dtype=np.int32)
+        opp[0] = deck[a]
+        opp[1] = deck[b]
+        opp[2:2 + n_known] = community
+        score = 0.0
+        total = 0
+        if k == 0:
+            s = evaluate_7hand(opp)
+            h = hero_strength[0, 0]
+            score = 1.0 if h > s else (0.5 if h == s else 0.0)
+            total = 1
+        elif k == 1:
+            for i in range(n):
+                if i == a or i == b:
+                    continue
+                opp[6] = deck[i]
+                s = evaluate_7hand(opp)
+                h = hero_strength[i, i]
+                score += 1.0 if h > s else (0.5 if h == s else 0.0)
+                total += 1
+        else:
+            for i in range(n):
+                if i == a or i == b:
+                    continue
+                opp[5] = deck[i]
+                for j in range(i + 1, n):
+                    if j == a or j == b:
+                        continue
+                    opp[6] = deck[j]
+                    s = evaluate_7hand(opp)
+                    h = hero_strength[i, j]
+                    score += 1.0 if h > s else (0.5 if h == s else 0.0)
+                    total += 1
+        equities[p] = score / total
+    return equities
+
+def _distribution(counts):
+    return {name: float(c) for name, c in zip(CATEGORY_NAMES, counts / counts.sum()) if c}
+
+def _board_category(cards):
+    # Category the board plays on its own, for three to five card indices.
+    if len(cards) == 5:
+        return evaluate_7hand(np.array(cards, dtype=np.int32)) >> 20
+    counts = sorted(np.bincount([c // 4 for c in cards], minlength=13))
+    if counts[-1] == 4:
+        return 7
+    if counts[-1] == 3:
+        return 3
+    if counts[-2] == 2:
+        return 2
+    return 1 if counts[-1] == 2 else 0
+
+def current_category(player_hand, community_cards=None):
+    cards = [card_to_index(c) for c in list(player_hand) + list(community_cards or [])]
+    if len(cards) < 5:
+        return 'pair' if len({c // 4 for c in cards}) < len(cards) else 'high card'
+    return CATEGORY_NAMES[evaluate_7hand(np.array(cards, dtype=np.int32)) >> 20]
+
+def improvement(player_hand, community_cards=None, num_decks=1, river=True):
+    # Outs on the next card and the exact category distribution at the river.
+    # Cheap enough to run on every decision postflop (well under a
+    # millisecond). Preflop the river distribution enumerates every
+    # five-card board, about 120ms; river=False skips it.
+    community = list(community_cards or [])
+    ph = np.array([card_to_index(c) for c in player_hand], dtype=np.int32)
+    comm = np.array([card_to_index(c) for c in community], dtype=np.int32)
+    known = np.concatenate((ph, comm))
+    deck = _live_deck(ph, comm, num_decks)
+    category = current_category(player_hand, community)
+    current = CATEGORY_NAMES.index(category)
+    outs = {}
+    if len(community) in (3, 4):
+        # An out has to improve our category by more than it improves the
+        # board's own, so the gain comes from our hole cards: with AA on K72
+        # a king makes two pair for us but pairs the board too.
+        board = [int(c) for c in comm]
+        board_current = _board_category(board)
+        for card, cat in zip(deck, _next_card_categories(known, deck)):
+            if cat > current and cat - current > _board_category(board + [int(card)]) - board_current:
+                outs.setdefault(CATEGORY_NAMES[cat], []).append(index_to_card(int(card)))
+        next_street = _category_counts(known, deck, 1)
+    elif not community:
+        next_street = _category_counts(known, deck, 3)
+    else:
+        next_street = None
+    river_counts = _category_counts(known, deck, 5 - len(community)) if river or community else None
+    return (category, outs, _distribution(next_street) if next_street is not None else None,
+            _distribution(river_counts) if river_counts is not None else None)
+
+def analyze(player_hand, community_cards=None, num_decks=1, histogram=True, river=True):
+    # Everything is enumerated exactly. The equity histogram needs a flop,
+    # turn or river board; on the flop it is the slow part (every opponent
+    # holding times every turn and river, about 50ms). Preflop the river
+    # distribution is (about 120ms, see improvement).
+    community = list(community_cards or [])
+    if len(player_hand) != 2:
+        raise ValueError("player must have exactly 2 cards")
+    if len(community) > 5 or len(community) in (1, 2):
+        raise ValueError("community cards must be a preflop, flop, turn or river board")
+    category, outs, next_street, river = improvement(player_hand, community, num_decks, river)
+    equity = None
+    equity_histogram = None
+    if histogram and community:
+        ph = np.array([card_to_index(c) for c in player_hand], dtype=np.int32)
+        comm = np.array([card_to_index(c) for c in community], dtype=np.int32)
+        with KERNEL_LOCK:
+            equities = _equity_vs_hands(ph, comm, _live_deck(ph, comm, num_decks))
+        equity = float(equities.mean())
+        counts, _ = np.histogram(equities, bins=HISTOGRAM_BINS, range=(0.0, 1.0))
+        equity_histogram = counts / len(equities)
+    return HandAnalysis(category, outs, next_street, river, equity, equity_histogram, board_texture(community))
+
+def warmup():
+    # Compiles, or loads from the on-disk numba cache, the kernels behind
+    # improvement and analyze on the flop and turn, which every postflop
+    # prompt uses. Returns seconds per step, like oddsfinder.warmup.
+    hand, flop, turn = ['As', 'Kh'], ['Qs', '7h', '2d'], ['Qs', '7h', '2d', '5c']
+    steps = (
+        ('improvement_flop', lambda: improvement(hand, flop)),
+        ('improvement_turn', lambda: improvement(hand, turn)),
+        ('analyze_flop', lambda: analyze(hand, flop)),
+        ('analyze_turn', lambda: analyze(hand, turn)),
+    )
+    timings = {}
+    for name, step in steps:
+        started = time.perf_counter()
+        step()
+        timings[name] = time.perf_counter() - started
+    return timings
@@ -0,0 +1,274 @@
+import argparse
+import gzip
+import json
+import os
+import random
+import re
+import tempfile
+import time
+import zlib
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from profiles import ProfileTable
+
+# One parsed hand. events are ('board', cards) or ('action', player_id,
+# {'type': ..., 'amount': ...}) in the order they happened; amounts are chips
+# added by that action, as GameStateTracker.record_action expects.
+Hand = namedtuple('Hand', 'table hand_id players cards events')
+
+HAND_START = re.compile(r"^(?:\w+ )*Hand #(\w+)")
+TABLE = re.compile(r"^Table '([^']+)'")
+SEAT = re.compile(r"^Seat \d+: (.+?) \(\$?([\d.]+) in chips")
+DEALT = re.compile(r"^Dealt to (.+?) \[(.+)\]")
+STREET = re.compile(r"^\*\*\* (FLOP|TURN|RIVER) \*\*\*.*\[([^\]]+)\]\s*$")
+POST = re.compile(r"^(.+?): posts (?:small blind|big blind|small & big blinds|the ante) \$?([\d.]+)")
+ACTION = re.compile(r"^(.+?): (folds|checks|calls|bets|raises)(?: \$?([\d.]+))?(?: to \$?([\d.]+))?(.*all-in)?")
+TABLE_FIELD = re.compile(r'"table"\s*:\s*"((?:[^"\\]|\\.)*)"')
+ACTION_TYPES = {'folds': 'fold', 'checks': 'check', 'calls': 'call', 'bets': 'bet', 'raises': 'raise'}
+
+def _open(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, encoding='utf-8')
+
+def _chips(value):
+    chips = float(value)
+    return int(chips) if chips.is_integer() else chips
+
+def shard_of(table, shards):
+    # Stable across processes, unlike hash().
+    return zlib.crc32(str(table).encode()) % shards
+
+def _text_blocks(path):
+    # Raw hands from a text history: (table, lines). Hands are separated by
+    # blank lines and start with a 'Hand #' header.
+    block = []
+    table = None
+    with _open(path) as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if not line.strip():
+                if block:
+                    yield table, block
+                block, table = [], None
+                continue
+            if HAND_START.match(line) and block:
+                yield table, block
+                block, table = [], None
+            if table is None:
+                match = TABLE.match(line)
+                if match:
+                    table = match.group(1)
+            block.append(line)
+    if block:
+        yield table, block
+
+def parse_text_hand(lines, table=None):
+    hand_id = None
+    players = {}
+    cards = []
+    events = []
+    street = {}
+    for line in lines:
+        match = ACTION.match(line)
+        if match:
+            player, verb, amount, to, all_in = match.groups()
+            action = {'type': ACTION_TYPES[verb], 'amount': 0}
+            if verb == 'raises':
+                total = _chips(to or amount)
+                action['amount'] = total - street.get(player, 0)
+                street[player] = total
+            elif verb in ('calls', 'bets'):
+                action['amount'] = _chips(amount)
+                street[player] = street.get(player, 0) + action['amount']
+            if all_in and verb in ('bets', 'raises'):
+                action['type'] = 'all-in'
+            events.append(('action', player, action))
+            continue
+        match = STREET.match(line)
+        if match:
+            events.append(('board', match.group(2).split()))
+            street = {}
+            continue
+        match = POST.match(line)
+        if match:
+            street[match.group(1)] = street.get(match.group(1), 0) + _chips(match.group(2))
+            continue
+        match = SEAT.match(line)
+        if match and not events:
+            players[match.group(1)] = _chips(match.group(2))
+            continue
+        match = DEALT.match(line)
+        if match:
+            cards = match.group(2).split()
+            continue
+        if hand_id is None:
+            match = HAND_START.match(line)
+            if match:
+                hand_id = match.group(1)
+                continue
+        if table is None:
+            match = TABLE.match(line)
+            if match:
+                table = match.group(1)
+    return Hand(table, hand_id, players, cards, events)
+
+def parse_json_hand(record):
+    # JSONL format: one hand per line,
+    # {"table": ..., "hand_id": ..., "players": {id: stack}, "cards": [...],
+    #  "events": [{"player": id, "type": "raise", "amount": 300}, {"board": [...]}, ...]}
+    events = []
+    for event in record.get('events', ()):
+        if 'board' in event:
+            events.append(('board', list(event['board'])))
+        else:
+            events.append(('action', event['player'], {'type': event['type'], 'amount': event.get('amount', 0)}))
+    return Hand(record.get('table'), record.get('hand_id'), record.get('players', {}),
+                record.get('cards', []), events)
+
+def iter_hands(paths, shard=0, shards=1):
+    # Streams the hands of one shard out of any mix of text and JSONL (.jsonl,
+    # optionally .gz) files. Hands of other shards are skipped before they are
+    # parsed, so every worker can scan the same files.
+    if isinstance(paths, str):
+        paths = [paths]
+    for path in paths:
+        if path.endswith(('.jsonl', '.jsonl.gz')):
+            with _open(path) as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    if shards > 1:
+                        match = TABLE_FIELD.search(line)
+                        table = json.loads(f'"{match.group(1)}"') if match else json.loads(line).get('table')
+                        if shard_of(table, shards) != shard:
+                            continue
+                    yield parse_json_hand(json.loads(line))
+        else:
+            for table, lines in _text_blocks(path):
+                if shards > 1 and shard_of(table, shards) != shard:
+                    continue
+                yield parse_text_hand(lines, table)
+
+def replay_hand(tracker, hand):
+    tracker.new_hand(list(hand.cards), dict(hand.players))
+    for event in hand.events:
+        if event[0] == 'board':
+            tracker.update_board(event[1])
+        else:
+            tracker.record_action(event[1], event[2])
+
+def _replay_tracker():
+    # Imported here so parsing alone doesn't pull in the equity engine.
+    from mainbluffer import GameStateTracker, PokerAIAnalyzer
+
+    analyzers = PokerAIAnalyzer()
+    analyzers.player_profiles = ProfileTable()
+    # Replayed hands are already recorded.
+    return GameStateTracker(analyzers, track_equity=False, log=False)
+
+def replay_shard(paths, shard=0, shards=1):
+    # Replays one shard through its own tracker. Returns (profiles, hands,
+    # actions).
+    tracker = _replay_tracker()
+    hands = actions = 0
+    for hand in iter_hands(paths, shard, shards):
+        replay_hand(tracker, hand)
+        hands += 1
+        actions += sum(1 for event in hand.events if event[0] == 'action')
+    tracker.analyzers.player_profiles.flush()
+    return tracker.analyzers.player_profiles, hands, actions
+
+def ingest(paths, workers=None, profiles=None):
+    # Replays every hand in paths across worker processes, one shard of
+    # tables each, and merges the resulting profiles into profiles (a new
+    # ProfileTable by default). Returns (profiles, hands, actions).
+    if isinstance(paths, str):
+        paths = [paths]
+    workers = workers or os.cpu_count() or 1
+    profiles = profiles if profiles is not None else ProfileTable()
+    hands = actions = 0
+    if workers == 1:
+        results = [replay_shard(paths)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(replay_shard, [paths] * workers, range(workers), [workers] * workers))
+    for shard_profiles, shard_hands, shard_actions in results:
+        profiles.merge(shard_profiles)
+        hands += shard_hands
+        actions += shard_actions
+    return profiles, hands, actions
+
+def write_synthetic_history(path, num_hands, num_tables=50, players_per_table=6, seed=0):
+    # Random but well-formed hands in the JSONL format, for benchmarking.
+    rng = random.Random(seed)
+    deck = [r + s for r in '23456789TJQKA' for s in 'shdc']
+    with open(path, 'w') as f:
+        for hand_id in range(num_hands):
+            table = hand_id % num_tables
+            seats = [f'p{table}_{i}' for i in range(players_per_table)]
+            cards = rng.sample(deck, 7)
+            events = []
+            live = list(seats)
+            for street, board in enumerate(([], cards[2:5], cards[5:6], cards[6:7])):
+                if board:
+                    events.append({'board': board})
+                bet = 100 if street == 0 else 0
+                for player in list(live):
+                    if len(live) == 1:
+                        break
+                    roll = rng.random()
+                    if bet and roll < 0.45:
+                        events.append({'player': player, 'type': 'fold'})
+                        live.remove(player)
+                    elif roll < 0.8:
+                        events.append({'player': player, 'type': 'call' if bet else 'check', 'amount': bet})
+                    else:
+                        bet = bet * 3 if bet else 150
+                        events.append({'player': player, 'type': 'raise' if street == 0 else 'bet', 'amount': bet})
+            record = {'table': f'table{table}', 'hand_id': hand_id,
+                      'players': {p: 10000 for p in seats}, 'cards': cards[:2], 'events': events}
+            f.write(json.dumps(record) + '\n')
+
+def benchmark(num_hands=200000, workers=None):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'history.jsonl')
+        write_synthetic_history(path, num_hands)
+        start = time.perf_counter()
+        profiles, hands, actions = ingest(path, workers)
+        elapsed = time.perf_counter() - start
+    return {
+        'hands': hands,
+        'actions': actions,
+        'players': len(profiles),
+        'seconds': elapsed,
+        'hands_per_second': hands / elapsed,
+        'actions_per_second': actions / elapsed,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Replay hand histories into opponent profiles')
+    commands = parser.add_subparsers(dest='command', required=True)
+    load = commands.add_parser('ingest', help='replay text or JSONL hand histories')
+    load.add_argument('paths', nargs='+')
+    load.add_argument('--workers', type=int, default=None)
+    load.add_argument('--store', default=None, help='SQLite profile store to add the results to')
+    bench = commands.add_parser('benchmark', help='measure ingestion throughput on synthetic hands')
+    bench.add_argument('--hands', type=int, default=200000)
+    bench.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    if args.command == 'ingest':
+        from profiles import ProfileStore
+
+        store = ProfileStore(args.store) if args.store else None
+        profiles, hands, actions = ingest(args.paths, args.workers, ProfileTable(store=store))
+        print(f"Replayed {hands} hands ({actions} actions) for {len(profiles)} players")
+        if store is not None:
+            profiles.flush()
+            store.close()
+    else:
+        result = benchmark(args.hands, args.workers)
+        print(f"{result['hands']} hands, {result['actions']} actions in {result['seconds']:.2f}s: "
+              f"{result['hands_per_second']:.0f} hands/s, {result['actions_per_second']:.0f} actions/s")
@@ -0,0 +1,247 @@
+import bisect
+import os
+import sys
+import threading
+import time
+from collections import Counter as _StackCounter, deque
+from functools import wraps
+
+# Timers, counters and histograms for the decision path. Everything is
+# process-wide and cheap enough to leave on; when disabled, timer() hands
+# back a shared no-op and counters skip the update.
+ENABLED = os.environ.get('POKERGPT_METRICS', '1') != '0'
+PREFIX = 'pokergpt_'
+SECONDS_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_metrics = {}
+
+def enable(on=True):
+    global ENABLED
+    ENABLED = on
+
+def disable():
+    enable(False)
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help=''):
+        self.name = name
+        self.help = help
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        if ENABLED:
+            with self.lock:
+                self.value += amount
+
+    def snapshot(self):
+        return {'value': self.value}
+
+    def prometheus(self):
+        return [f"{PREFIX}{self.name} {self.value}"]
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help='', buckets=SECONDS_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        if not ENABLED:
+            return
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding quantile q.
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            seen += count
+            if seen >= target and count:
+                return min(bound, self.max)
+        return 0.0
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count else 0.0,
+            'max': self.max,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'buckets': dict(zip([str(b) for b in self.buckets] + ['+Inf'], self.counts)),
+        }
+
+    def prometheus(self):
+        lines = []
+        cumulative = 0
+        for bound, count in zip([repr(b) for b in self.buckets] + ['+Inf'], self.counts):
+            cumulative += count
+            lines.append(f'{PREFIX}{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f"{PREFIX}{self.name}_sum {self.sum}")
+        lines.append(f"{PREFIX}{self.name}_count {self.count}")
+        return lines
+
+def _get(cls, name, help, **kwargs):
+    metric = _metrics.get(name)
+    if metric is None:
+        with _lock:
+            metric = _metrics.get(name)
+            if metric is None:
+                metric = _metrics[name] = cls(name, help, **kwargs)
+    return metric
+
+def counter(name, help=''):
+    return _get(Counter, name, help)
+
+def histogram(name, help='', buckets=SECONDS_BUCKETS):
+    return _get(Histogram, name, help, buckets=buckets)
+
+class _Timer:
+    __slots__ = ('histogram', 'started')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started)
+        return False
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NULL_TIMER = _NullTimer()
+
+def timer(name, help=''):
+    # with timer('stage_seconds'): ... records the block's wall time.
+    if not ENABLED:
+        return NULL_TIMER
+    return _Timer(_metrics.get(name) or histogram(name, help))
+
+def timed(name, help=''):
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return fn(*args, **kwargs)
+            with _Timer(histogram(name, help)):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def snapshot():
+    # JSON-ready view of every metric.
+    return {name: dict(metric.snapshot(), type=metric.kind) for name, metric in sorted(_metrics.items())}
+
+def prometheus_text():
+    lines = []
+    for name, metric in sorted(_metrics.items()):
+        if metric.help:
+            lines.append(f"# HELP {PREFIX}{name} {metric.help}")
+        lines.append(f"# TYPE {PREFIX}{name} {metric.kind}")
+        lines.extend(metric.prometheus())
+    return '\n'.join(lines) + '\n'
+
+def reset():
+    with _lock:
+        _metrics.clear()
+
+class SamplingProfiler:
+    # Samples one thread's Python stack every interval seconds from a helper
+    # thread. Stacks are kept in collapsed form ('outer;inner' -> samples),
+    # which flamegraph tools read directly.
+    def __init__(self, thread_id=None, interval=0.001):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.stacks = _StackCounter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+                self.samples += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self
+
+    def collapsed(self):
+        return '\n'.join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+PROFILES = deque(maxlen=16)  # (label, seconds, SamplingProfiler) for recent profiled blocks
+_profile_requests = 0
+
+def profile_next(count=1):
+    # Arms the sampling profiler for the next count profiled() blocks.
+    global _profile_requests
+    with _lock:
+        _profile_requests += count
+
+class profiled:
+    # with profiled('decision'): ... samples the block if profile_next() armed it.
+    __slots__ = ('label', 'profiler', 'started')
+
+    def __init__(self, label, interval=0.001):
+        global _profile_requests
+        self.label = label
+        self.profiler = None
+        if _profile_requests:
+            with _lock:
+                if _profile_requests:
+                    _profile_requests -= 1
+                    self.profiler = SamplingProfiler(interval=interval)
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        if self.profiler is not None:
+            self.profiler.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self.profiler is not None:
+            self.profiler.stop()
+            PROFILES.append((self.label, time.perf_counter() - self.started, self.profiler))
+        return False
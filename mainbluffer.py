@@ -1,47 +1,206 @@
-import requests
-import json
+import asyncio
+import atexit
+import threading
+import time
+import weakref
 import numpy as np
-from collections import defaultdict, deque
+from concurrent.futures import CancelledError, ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import event_log as events
+import hand_analyzer
+import instrumentation
+import oddsfinder
+from decision_client import DecisionCache, DecisionClient, fallback_action
+from profiles import ProfileStore, ProfileTable
 
 # Configuration
 OPENROUTER_API_KEY = "your-api-key"
 DEEPSEEK_MODEL = "deepseek\deepseel-r1"
-MAX_HISTORY = 10  # Last 10 moves remembered per player
+EQUITY_WORKERS = 2
+EQUITY_TARGET_SE = 0.5  # Background equity stops at this standard error (percentage points)
+EQUITY_WAIT = 0.25  # Seconds get_ai_decision waits for a better estimate
+QUICK_EQUITY_SIMULATIONS = 8000  # Synchronous estimate when the background job hasn't produced one
+DECISION_BUDGET = 8.0  # Seconds before ai_decision falls back to an equity-based action
+LLM_CONCURRENCY = 8  # Requests in flight across all tables
+DECISION_CACHE_TTL = 3600  # Seconds a cached model decision stays valid
+DECISION_CACHE_PATH = None  # Set to a JSON file to keep cached decisions across sessions
+PROFILE_STORE_PATH = None  # Set to an SQLite file to keep opponent profiles across sessions
+EVENT_LOG_PATH = None  # Set to a path prefix to log every table event in binary segments
+HERO_ID = 'hero'  # Player id used for our own seat
+FAST_PATH_MARGIN = 0.15  # Calls whose EV is within this fraction of the pot go to the model
+FAST_PATH_VALUE_EQUITY = 0.85  # Showdown equity at which we bet or raise without asking
+
+_equity_pool = None
+_decision_client = None
+_profile_store = None
+_event_log = None
+_profile_tables = weakref.WeakSet()  # Every analyzer's ProfileTable, flushed at exit
+
+def decision_client():
+    global _decision_client
+    if _decision_client is None:
+        cache = DecisionCache(ttl=DECISION_CACHE_TTL, path=DECISION_CACHE_PATH)
+        _decision_client = DecisionClient(OPENROUTER_API_KEY, DEEPSEEK_MODEL,
+                                          max_concurrency=LLM_CONCURRENCY, cache=cache)
+        if DECISION_CACHE_PATH is not None:
+            atexit.register(cache.save)
+    return _decision_client
+
+def profile_store():
+    global _profile_store
+    if _profile_store is None and PROFILE_STORE_PATH is not None:
+        _profile_store = ProfileStore(PROFILE_STORE_PATH)
+        atexit.register(_close_profile_store, _profile_store)
+    return _profile_store
+
+def _close_profile_store(store):
+    # Tables only hand their deltas to the store at the next begin_hand, and
+    # the writer is a daemon thread, so flush both before the process exits.
+    for profiles in list(_profile_tables):
+        if profiles.store is store:
+            profiles.flush()
+    store.close()
+
+def event_log():
+    global _event_log
+    if _event_log is None and EVENT_LOG_PATH is not None:
+        _event_log = events.EventLog(EVENT_LOG_PATH)
+        # Up to BUFFER_RECORDS events wait in memory for the next write.
+        atexit.register(_event_log.close)
+    return _event_log
+
+def equity_pool():
+    global _equity_pool
+    if _equity_pool is None:
+        _equity_pool = ThreadPoolExecutor(max_workers=EQUITY_WORKERS, thread_name_prefix='equity')
+    return _equity_pool
+
+def shutdown_equity_pool():
+    # Drops queued jobs; running ones stop after their current batch once
+    # cancelled. Otherwise interpreter exit waits for every queued job.
+    global _equity_pool
+    if _equity_pool is not None:
+        _equity_pool.shutdown(wait=False, cancel_futures=True)
+        _equity_pool = None
+
+class EquityJob:
+    # Background adaptive equity for one (hand, board, players) spot. The
+    # running estimate is published after every batch.
+    def __init__(self, hand, board, num_players, pool=None):
+        self.key = (tuple(hand), tuple(board), num_players)
+        self.num_opponents = max(1, num_players - 1)
+        self.estimate = None
+        self.cancelled = threading.Event()
+        self.future = (pool or equity_pool()).submit(
+            oddsfinder.adaptive_odds, list(hand), list(board),
+            target_se=EQUITY_TARGET_SE, num_opponents=self.num_opponents,
+            on_batch=self._publish
+        )
+
+    def _publish(self, estimate):
+        self.estimate = estimate
+        return not self.cancelled.is_set()
+
+    def cancel(self):
+        self.cancelled.set()
+        self.future.cancel()
+
+    def result(self, timeout=EQUITY_WAIT):
+        # Final result if it lands in time, otherwise the latest partial one.
+        # A job still queued behind other tables is dropped for a quick
+        # synchronous estimate rather than waited on.
+        try:
+            return self.future.result(timeout)
+        except (FutureTimeout, CancelledError):
+            if self.estimate is not None:
+                return self.estimate
+            self.cancel()
+            hand, board, _ = self.key
+            self.estimate = oddsfinder.adaptive_odds(
+                list(hand), list(board), num_opponents=self.num_opponents,
+                batch_size=QUICK_EQUITY_SIMULATIONS // 4, max_simulations=QUICK_EQUITY_SIMULATIONS
+            )
+            return self.estimate
+
+class FastPathPolicy:
+    # Answers clear-cut spots in-process and returns None for everything else,
+    # which then goes to the model. Equity is hero's expected showdown share.
+    def __init__(self, margin=FAST_PATH_MARGIN, value_equity=FAST_PATH_VALUE_EQUITY):
+        self.margin = margin
+        self.value_equity = value_equity
+        self.decisions = 0
+        self.escalations = 0
+
+    def decide(self, equity, pot, to_call, stack, big_blind, opponents):
+        self.decisions += 1
+        if to_call > 0 and opponents:
+            # Bluff-prone bettors are called down a little lighter.
+            bluffing = np.mean([p.bluff_tendency for p in opponents.values()])
+            equity = min(1.0, equity + 0.1 * (bluffing - 0.2))
+        confidence = int(round(equity * 100))
+        if to_call > 0:
+            call_ev = equity * (pot + to_call) - to_call
+            if call_ev < -self.margin * (pot + to_call):
+                return {"action": "fold", "confidence": confidence, "fast_path": True}
+        if equity >= self.value_equity:
+            amount = max(2 * to_call, int(0.75 * (pot + to_call)), big_blind)
+            if amount >= stack:
+                return {"action": "all-in", "amount": stack, "confidence": confidence, "fast_path": True}
+            return {"action": "raise", "amount": amount, "confidence": confidence, "fast_path": True}
+        self.escalations += 1
+        return None
+
+    def stats(self):
+        return {
+            'decisions': self.decisions,
+            'escalations': self.escalations,
+            'escalation_rate': self.escalations / self.decisions if self.decisions else 0.0,
+        }
 
 class PokerAIAnalyzer:
-    def __init__(self):
-        self.player_profiles = defaultdict(lambda: {
-            'aggression': 0.5,
-            'bluff_tendency': 0.2,
-            'call_frequency': 0.6,
-            'action_history': deque(maxlen=MAX_HISTORY)
-        })
-        self.game_history = []
+    def __init__(self, equity_pool=None, decision_client=None, store=None):
+        self.player_profiles = ProfileTable(store=store or profile_store())
+        _profile_tables.add(self.player_profiles)
+        self.game_history = []  # This hand's decisions; older ones are in the event log
         self.current_pot = 0
         self.blind_structure = (50, 100)
         self.stack_sizes = {}
+        self.equity_pool = equity_pool
+        self.decision_client = decision_client
+        self.equity_job = None
+        self.equity_interval = None
+        self.policy = FastPathPolicy()
+
+    def start_equity(self, hand, board, num_players=6):
+        if self.equity_job is not None:
+            self.equity_job.cancel()
+        self.equity_job = EquityJob(hand, board, num_players, self.equity_pool)
 
     def calculate_odds(self, hand, board, num_players=6, simulations=3000):
-        # ... (Implement your hand equity calculator here) ...
-        # Return win_prob, tie_prob
-        return 0.35, 0.05  # Placeholder
+        # Uses the background job for this spot if there is one, otherwise
+        # computes synchronously. Returns win_prob, tie_prob as fractions.
+        job = self.equity_job
+        if job is not None and job.key == (tuple(hand), tuple(board), num_players):
+            with instrumentation.timer('equity_wait_seconds', 'Waiting on the background equity job'):
+                estimate = job.result()
+            self.equity_interval = (estimate.interval[0] / 100, estimate.interval[1] / 100)
+            return estimate.win / 100, estimate.tie / 100
+        win, tie = oddsfinder.calculate_odds(
+            hand, board, simulations,
+            num_opponents=max(1, num_players - 1),
+            use_pokerkit=False
+        )
+        self.equity_interval = None
+        return win / 100, tie / 100
 
+    @instrumentation.timed('profile_update_seconds', 'Opponent profile updates')
     def update_profiles(self, action_sequence):
         for player_id, action in action_sequence.items():
-            profile = self.player_profiles[player_id]
-            profile['action_history'].append(action)
-            
-            # Analyze aggression
-            aggressive_actions = sum(1 for a in profile['action_history'] 
-                                   if a['action'] in ['raise', 'all-in'])
-            profile['aggression'] = aggressive_actions / len(profile['action_history'])
-            
-            # Calculate bluff tendency (simplified)
-            if action['action'] == 'bluff':
-                profile['bluff_tendency'] = 0.9 * profile['bluff_tendency'] + 0.1
-            else:
-                profile['bluff_tendency'] *= 0.95
+            self.player_profiles.record(
+                player_id, action.get('action', action.get('type')), action.get('amount', 0)
+            )
 
+    @instrumentation.timed('prompt_build_seconds', 'Building the model prompt')
     def build_context_prompt(self, hand, board, win_prob, players):
         prompt = f"""Poker Decision Context:
 Current Hand: {hand}
@@ -55,91 +214,232 @@ Player Profiles:
 """
         for pid, profile in players.items():
             prompt += f"""- Player {pid}:
-  Aggression: {profile['aggression']:.0%}
-  Bluff Tendency: {profile['bluff_tendency']:.0%}
-  Recent Actions: {list(profile['action_history'])[-3:]}
+  Aggression: {profile.aggression:.0%}
+  Bluff Tendency: {profile.bluff_tendency:.0%}
+  Recent Actions: {list(profile.action_history)[-3:]}
   
+"""
+        if len(board) in (3, 4):
+            # Exact outs from the analyzer, well under a millisecond.
+            category, outs, _, _ = hand_analyzer.improvement(hand, board)
+            texture = hand_analyzer.board_texture(board)
+            features = [name for name in ('paired', 'monotone', 'flush_possible', 'straight_possible')
+                        if getattr(texture, name)]
+            prompt += f"""Made Hand: {category}
+Outs: {', '.join(f'{len(cards)} to {name}' for name, cards in outs.items()) or 'none'}
+Board Texture: {', '.join(features) or 'dry'}
+
 """
         prompt += """\nConsidering the pot odds, table position, and opponent tendencies, recommend the action with confidence percentage. Output format: {"action": "raise", "amount": 500, "confidence": 65}"""
         return prompt
 
-    def ai_decision(self, prompt):
-        headers = {
-            "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-            "Content-Type": "application/json"
-        }
+    def decision_signature(self, hand, board, win_prob, players, to_call=0):
+        # Spots that bucket the same get the same model decision: 5% equity
+        # steps, street, pot odds in 5% steps, pot and stack depth in big
+        # blinds on a doubling scale, and each of this hand's opponents'
+        # aggression and bluff tendency in quarters.
+        big_blind = self.blind_structure[1] or 1
+        def depth(chips):
+            return int(np.log2(1 + chips / big_blind))
+        opponents = tuple(sorted(
+            (min(int(profile.aggression * 4), 3), min(int(profile.bluff_tendency * 4), 3))
+            for profile in players.values()
+        ))
+        return (
+            int(round(win_prob * 20)),
+            len(board),
+            int(round(to_call / (self.current_pot + to_call) * 20)) if to_call else 0,
+            depth(self.current_pot),
+            depth(self.stack_sizes.get('hero', 0)),
+            opponents,
+        )
 
-        payload = {
-            "model": DEEPSEEK_MODEL,
-            "messages": [{
-                "role": "user",
-                "content": prompt
-            }],
-            "temperature": 0.7,
-            "max_tokens": 150
-        }
+    @instrumentation.timed('llm_decision_seconds', 'Model decisions including cache hits and fallbacks')
+    def ai_decision(self, prompt, win_prob=None, budget=DECISION_BUDGET, cache_key=None, to_call=0):
+        client = self.decision_client or decision_client()
+        return client.decide_blocking(prompt, budget, fallback_action(win_prob, self.current_pot, to_call), cache_key)
 
-        try:
-            response = requests.post("https://openrouter.ai/api/v1/chat/completions",
-                                    headers=headers, data=json.dumps(payload))
-            response_data = json.loads(response.text)
-            return json.loads(response_data['choices'][0]['message']['content'])
-        except Exception as e:
-            print(f"API Error: {e}")
-            return {"action": "check", "confidence": 50}
+    async def ai_decision_async(self, prompt, win_prob=None, budget=DECISION_BUDGET, cache_key=None, to_call=0):
+        client = self.decision_client or decision_client()
+        with instrumentation.timer('llm_decision_seconds', 'Model decisions including cache hits and fallbacks'):
+            return await client.decide(prompt, budget, fallback_action(win_prob, self.current_pot, to_call), cache_key)
 
 class GameStateTracker:
-    def __init__(self):
+    # track_equity=False skips the background equity jobs, for replaying
+    # recorded hands where only the profiles matter. Only the current hand is
+    # kept in memory; with an event log every event is also written there.
+    # log=None uses the process-wide log (if EVENT_LOG_PATH is set) and
+    # log=False disables logging.
+    def __init__(self, analyzers=None, track_equity=True, table='', log=None):
         self.current_hand = []
         self.community_cards = []
         self.action_sequence = []
+        self.table = table
+        self.hand_number = 0
+        self.log = event_log() if log is None else (log or None)
         self.players = {}
-        self.analyzers = PokerAIAnalyzer()
+        self.street_bets = {}
+        self.committed = {}
+        self.folded = set()
+        self.analyzers = analyzers or PokerAIAnalyzer()
+        self.track_equity = track_equity
 
     def new_hand(self, hand, players):
         self.current_hand = hand
         self.community_cards = []
+        self.action_sequence = []
         self.players = players
+        self.street_bets = {}
+        self.committed = {}
+        self.folded = set()
+        self.hand_number += 1
+        self.analyzers.game_history.clear()
         self.analyzers.stack_sizes = players
+        self.analyzers.current_pot = sum(self.analyzers.blind_structure)
+        self.analyzers.player_profiles.begin_hand()
+        if self.log is not None:
+            self.log.log(events.HAND, self.table, self.hand_number, pot=self.analyzers.current_pot,
+                         cards=hand)
+            for pid, stack in players.items():
+                self.log.log(events.SEAT, self.table, self.hand_number, player=pid, amount=stack)
+        if self.track_equity:
+            self.analyzers.start_equity(self.current_hand, self.community_cards, len(self.players))
 
     def update_board(self, cards):
         self.community_cards.extend(cards)
+        self.street_bets = {}
+        self.analyzers.player_profiles.begin_street(len(self.community_cards))
+        if self.log is not None:
+            self.log.log(events.BOARD, self.table, self.hand_number, len(self.community_cards),
+                         cards=cards)
+        if self.track_equity:
+            self.analyzers.start_equity(self.current_hand, self.community_cards, len(self.players))
 
     def record_action(self, player_id, action):
-        self.action_sequence.append({
+        amount = action.get('amount', 0)
+        if action['type'] == 'fold':
+            self.folded.add(player_id)
+        if action['type'] == 'call' and not amount:
+            amount = max(self.street_bets.values(), default=0) - self.street_bets.get(player_id, 0)
+        self.street_bets[player_id] = self.street_bets.get(player_id, 0) + amount
+        self.committed[player_id] = self.committed.get(player_id, 0) + amount
+        self.analyzers.current_pot += amount
+        record = {
             'player': player_id,
             'action': action['type'],
-            'amount': action.get('amount', 0),
+            'amount': amount,
             'stage': len(self.community_cards)  # Track round
-        })
-        self.analyzers.update_profiles({player_id: action})
+        }
+        self.action_sequence.append(record)
+        self.analyzers.update_profiles({player_id: record})
+        if self.log is not None:
+            self.log.log(events.ACTION, self.table, self.hand_number, record['stage'], player_id,
+                         action['type'], amount, self.analyzers.current_pot)
 
-    def get_ai_decision(self):
-        win_prob, tie_prob = self.analyzers.calculate_odds(
-            self.current_hand, self.community_cards
-        )
-        prompt = self.analyzers.build_context_prompt(
-            self.current_hand, self.community_cards,
-            win_prob, self.analyzers.player_profiles
+    def allin_equity(self, simulations=20000):
+        # Each live player's expected share of the pot if everyone still in
+        # the hand got all in now, with opponents' cards unknown. Stacks are
+        # as dealt, so each live player risks their whole stack, chips
+        # already committed included. Folded players' chips and the blinds
+        # (not attributed to a seat) are dead money in the main pot.
+        live = [pid for pid in self.players if pid not in self.folded]
+        contributions = [max(self.players[pid], self.committed.get(pid, 0)) for pid in live]
+        dead_money = self.analyzers.current_pot - sum(self.committed.get(pid, 0) for pid in live)
+        result = oddsfinder.allin_equity(
+            [self.current_hand if pid == HERO_ID else None for pid in live],
+            contributions, self.community_cards, simulations,
+            dead_money=max(0, dead_money)
         )
-        return self.analyzers.ai_decision(prompt)
+        return dict(zip(live, result.share))
+
+    def to_call(self):
+        highest = max(self.street_bets.values(), default=0)
+        if not self.community_cards:
+            highest = max(highest, self.analyzers.blind_structure[1])
+        return max(0, highest - self.street_bets.get(HERO_ID, 0))
+
+    def _prepare_decision(self):
+        # Returns (decision, None) when the fast path answers, otherwise
+        # (None, (prompt, win_prob, signature)) for the model.
+        # profile_next() samples this, the CPU-bound part of a decision.
+        with instrumentation.profiled('decision'):
+            win_prob, tie_prob = self.analyzers.calculate_odds(
+                self.current_hand, self.community_cards, len(self.players)
+            )
+            if self.log is not None:
+                self.log.log(events.EQUITY, self.table, self.hand_number, len(self.community_cards),
+                             pot=self.analyzers.current_pot, win=win_prob, tie=tie_prob)
+            # Pairwise equity against each opponent still in the hand,
+            # compounded as a rough estimate of taking the pot against all of them.
+            opponents = {pid: self.analyzers.player_profiles[pid] for pid in self.players
+                         if pid != HERO_ID and pid not in self.folded}
+            equity = (win_prob + tie_prob / 2) ** max(1, len(opponents))
+            to_call = self.to_call()
+            decision = self.analyzers.policy.decide(
+                equity, self.analyzers.current_pot, to_call,
+                self.players.get(HERO_ID, 0), self.analyzers.blind_structure[1], opponents
+            )
+            if decision is not None:
+                instrumentation.counter('fast_path_decisions_total', 'Decisions answered without the model').inc()
+                return decision, None
+            instrumentation.counter('model_decisions_total', 'Decisions sent to the model').inc()
+            prompt = self.analyzers.build_context_prompt(
+                self.current_hand, self.community_cards,
+                win_prob, opponents
+            )
+            signature = self.analyzers.decision_signature(
+                self.current_hand, self.community_cards,
+                win_prob, opponents, to_call
+            )
+            return None, (prompt, win_prob, signature)
+
+    def _finish_decision(self, decision, started):
+        self.analyzers.game_history.append(decision)
+        if self.log is not None:
+            self.log.log(events.DECISION, self.table, self.hand_number, len(self.community_cards), HERO_ID,
+                         decision.get('action'), decision.get('amount', 0), self.analyzers.current_pot,
+                         confidence=decision.get('confidence', 0), latency=time.perf_counter() - started,
+                         flags=events.FAST_PATH if decision.get('fast_path') else 0)
+        return decision
+
+    def get_ai_decision(self):
+        started = time.perf_counter()
+        with instrumentation.timer('decision_seconds', 'Whole decisions'):
+            decision, request = self._prepare_decision()
+            if decision is None:
+                prompt, win_prob, signature = request
+                decision = self.analyzers.ai_decision(prompt, win_prob, cache_key=signature, to_call=self.to_call())
+        return self._finish_decision(decision, started)
+
+    async def get_ai_decision_async(self, executor=None):
+        # The equity wait runs on executor so the event loop stays free.
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        with instrumentation.timer('decision_seconds', 'Whole decisions'):
+            decision, request = await loop.run_in_executor(executor, self._prepare_decision)
+            if decision is None:
+                prompt, win_prob, signature = request
+                decision = await self.analyzers.ai_decision_async(prompt, win_prob, cache_key=signature,
+                                                                  to_call=self.to_call())
+        return self._finish_decision(decision, started)
 
-# game logic
-game = GameStateTracker()
+if __name__ == "__main__":
+    # game logic
+    game = GameStateTracker()
 
-# Start new hand
-game.new_hand(
-    hand=['As', 'Kh'],
-    players={'me': 1500, 'villain1': 1200, 'villain2': 1800}
-)
+    # Start new hand
+    game.new_hand(
+        hand=['As', 'Kh'],
+        players={'hero': 1500, 'villain1': 1200, 'villain2': 1800}
+    )
 
-# Record previous actions
-game.record_action('villain1', {'type': 'raise', 'amount': 300})
-game.record_action('villain2', {'type': 'call'})
+    # Record previous actions
+    game.record_action('villain1', {'type': 'raise', 'amount': 300})
+    game.record_action('villain2', {'type': 'call'})
 
-# Update board
-game.update_board(['Qs', '7h', '2d'])
+    # Update board
+    game.update_board(['Qs', '7h', '2d'])
 
-# Get AI decision
-decision = game.get_ai_decision()
-print(f"AI recommends: {decision['action']} with {['confidence']}% confidence")
+    # Get AI decision
+    decision = game.get_ai_decision()
+    print(f"AI recommends: {decision['action']} with {['confidence']}% confidence")
@@ -1,187 +1,1376 @@
-import numpy as np
-from numba import njit, prange
-from pokerkit import HandUtilities
-from collections import Counter
-import random
-
-COMBINATIONS_7C5 = np.array([
-    [0,1,2,3,4], [0,1,2,3,5], [0,1,2,3,6],
-    [0,1,2,4,5], [0,1,2,4,6], [0,1,2,5,6],
-    [0,1,3,4,5], [0,1,3,4,6], [0,1,3,5,6],
-    [0,1,4,5,6], [0,2,3,4,5], [0,2,3,4,6],
-    [0,2,3,5,6], [0,2,4,5,6], [0,3,4,5,6],
-    [1,2,3,4,5], [1,2,3,4,6], [1,2,3,5,6],
-    [1,2,4,5,6], [1,3,4,5,6], [2,3,4,5,6]
-], dtype=np.uint8)
-
-@njit
-def evaluate_5card(five_cards):
-    ranks = (five_cards // 4).astype(np.int32)
-    suits = (five_cards % 4).astype(np.int32)
-    rank_counts = np.zeros(13, dtype=np.int32)
-    suit_counts = np.zeros(4, dtype=np.int32)
-    for i in range(5):
-        rank_counts[ranks[i]] += 1
-        suit_counts[suits[i]] += 1
-    flush = np.any(suit_counts >= 5)
-    if flush:
-        suit = np.argmax(suit_counts)
-        flush_ranks = ranks[suits == suit]
-        if len(flush_ranks) < 5:
-            flush = False
-    unique_ranks = np.unique(ranks)
-    straight = False
-    if len(unique_ranks) >= 5:
-        sorted_ranks = np.sort(unique_ranks)
-        for i in range(len(sorted_ranks)-4):
-            if sorted_ranks[i+4] - sorted_ranks[i] == 4:
-                straight = True
-                high = sorted_ranks[i+4]
-        if not straight and np.all(sorted_ranks[-4:] == [0, 9, 10, 11, 12]):
-            straight = True
-            high = 3
-    if straight and flush:
-        return (8, high)
-    if np.any(rank_counts == 4):
-        quad_rank = np.argmax(rank_counts)
-        kicker = np.max(ranks[ranks != quad_rank])
-        return (7, quad_rank, kicker)
-    if np.any(rank_counts == 3) and np.any(rank_counts == 2):
-        trips_rank = np.argmax(rank_counts == 3)
-        pair_rank = np.argmax(rank_counts == 2)
-        return (6, trips_rank, pair_rank)
-    if flush:
-        sorted_flush = np.sort(flush_ranks)[::-1][:5]
-        return (5, sorted_flush[0], sorted_flush[1], sorted_flush[2], sorted_flush[3], sorted_flush[4])
-    if straight:
-        return (4, high)
-    if np.any(rank_counts == 3):
-        trips_rank = np.argmax(rank_counts)
-        kickers = np.sort(ranks[ranks != trips_rank])[::-1][:2]
-        return (3, trips_rank, kickers[0], kickers[1])
-    if np.sum(rank_counts == 2) >= 2:
-        pairs = np.where(rank_counts == 2)[0][::-1]
-        kicker = np.max(ranks[~np.isin(ranks, pairs[:2])])
-        return (2, pairs[0], pairs[1], kicker)
-    if np.any(rank_counts == 2):
-        pair_rank = np.argmax(rank_counts)
-        kickers = np.sort(ranks[ranks != pair_rank])[::-1][:3]
-        return (1, pair_rank, kickers[0], kickers[1], kickers[2])
-    high_cards = np.sort(ranks)[::-1][:5]
-    return (0, high_cards[0], high_cards[1], high_cards[2], high_cards[3], high_cards[4])
-
-@njit
-def evaluate_7hand(seven_cards):
-    max_strength = (0,)
-    for i in range(21):
-        five_card = seven_cards[COMBINATIONS_7C5[i]]
-        strength = evaluate_5card(five_card)
-        if strength > max_strength:
-            max_strength = strength
-    return max_strength
-
-@njit(parallel=True)
-def monte_carlo_sim(player_hand, community, num_sims):
-    deck = np.array([c for c in range(52) if c not in player_hand and c not in community], dtype=np.int32)
-    n_comm_needed = 5 - len(community)
-    wins = 0
-    for i in prange(num_sims):
-        np.random.shuffle(deck)
-        comm_add = deck[:n_comm_needed]
-        opp_hand = deck[n_comm_needed:n_comm_needed+2]
-        full_comm = np.concatenate((community, comm_add))
-        player_full = np.concatenate((player_hand, full_comm))
-        opp_full = np.concatenate((opp_hand, full_comm))
-        player_strength = evaluate_7hand(player_full)
-        opp_strength = evaluate_7hand(opp_full)
-        if player_strength > opp_strength:
-            wins += 1
-        elif player_strength == opp_strength:
-            wins += 0.5
-    return wins / num_sims
-
-def calculate_win_percentage(player_hand, community_cards=None, simulations=100000, num_decks=1, num_opponents=1):
-    community = list(community_cards) if community_cards else []
-    needed_community = 5 - len(community)
-    known_cards = Counter(player_hand + community)
-    if len(player_hand) != 2:
-        raise ValueError("player must have exactly 2 cards")
-    if len(community) > 5:
-        raise ValueError("too many community cards")
-    if any(v > num_decks for v in known_cards.values()):
-        raise ValueError("duplicate cards exceed deck count")
-    deck = [
-        f"{r}{s}"
-        for _ in range(num_decks)
-        for r in '23456789TJQKA'
-        for s in 'shdc'
-    ]
-    wins = 0
-    ties = 0
-    for _ in range(simulations):
-        temp_deck = list(deck)
-        for card in known_cards:
-            for _ in range(known_cards[card]):
-                if card in temp_deck:
-                    temp_deck.remove(card)
-        needed = 2*num_opponents + needed_community
-        if len(temp_deck) < needed:
-            raise ValueError(f"need {needed} cards but only {len(temp_deck)} available")
-        random.shuffle(temp_deck)
-        new_community = temp_deck[:needed_community]
-        temp_deck = temp_deck[needed_community:]
-        all_community = community + new_community
-        if len(all_community) != 5:
-            raise RuntimeError("incorrect  card count")
-        player_cards = player_hand + all_community
-        player_rank = HandUtilities.get_rank(''.join(player_cards))
-        opponent_ranks = []
-        for _ in range(num_opponents):
-            opp_cards = temp_deck[:2] + all_community
-            temp_deck = temp_deck[2:]
-            opponent_ranks.append(HandUtilities.get_rank(''.join(opp_cards)))
-        results = [
-            HandUtilities.compare_ranks(player_rank, opp_rank)
-            for opp_rank in opponent_ranks
-        ]
-        wins += sum(r == 1 for r in results)
-        ties += sum(r == 0 for r in results)
-    total = simulations * num_opponents
-    return (wins/total*100, ties/total*100)
-
-def card_to_index(card_str):
-    rank_order = '23456789TJQKA'
-    suit_order = {'s':0, 'h':1, 'd':2, 'c':3}
-    return rank_order.index(card_str[0].upper()) * 4 + suit_order[card_str[1].lower()]
-
-def index_to_card(index):
-    ranks = '23456789TJQKA'
-    suits = 'shdc'
-    return f"{ranks[index//4]}{suits[index%4]}"
-
-def calculate_odds(player_hand, community_cards=None, simulations=100000, num_decks=1, num_opponents=1, use_pokerkit=True):
-    if use_pokerkit:
-        return calculate_win_percentage(
-            player_hand,
-            community_cards,
-            simulations,
-            num_decks,
-            num_opponents
-        )
-    else:
-        ph = np.array([card_to_index(c) for c in player_hand], dtype=np.int32)
-        comm = np.array([], dtype=np.int32)
-        if community_cards:
-            comm = np.array([card_to_index(c) for c in community_cards], dtype=np.int32)
-        win_prob = monte_carlo_sim(ph, comm, simulations)
-        return win_prob * 100, 0.0
-
-if __name__ == "__main__":
-    win, tie = calculate_odds(
-        ['As', 'Ac'],
-        ['Qh', 'Jh', 'Th'],
-        simulations=10000,
-        num_opponents=3,
-        use_pokerkit=True
-    )
-    print(f"Win: {win:.1f}% | Tie: {tie:.1f}%")
+import os
+import argparse
+import itertools
+import math
+import struct
+import numba
+import numpy as np
+from numba import njit, prange
+from collections import Counter, OrderedDict
+import random
+import threading
+import time
+from collections import namedtuple
+from statistics import NormalDist
+
+import instrumentation
+
+RANK_TABLE_PATH = os.environ.get(
+    'POKERGPT_RANK_TABLES',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rank_tables.npz')
+)
+RANK_TABLE_VERSION = 1
+PREFLOP_TABLE_PATH = os.environ.get(
+    'POKERGPT_PREFLOP_TABLE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'preflop_equity.bin')
+)
+PREFLOP_TABLE_VERSION = 1
+
+# The parallel kernels are called from equity and decision worker threads.
+# The workqueue layer aborts on concurrent launches and TBB's workers keep the
+# process from exiting once a kernel has run off the main thread, so OpenMP
+# goes first unless the environment picks a layer. KERNEL_LOCK serialises
+# launches whatever the layer; each launch already uses every core.
+if 'NUMBA_THREADING_LAYER' not in os.environ and 'NUMBA_THREADING_LAYER_PRIORITY' not in os.environ:
+    numba.config.THREADING_LAYER_PRIORITY = ['omp', 'workqueue', 'tbb']
+KERNEL_LOCK = threading.Lock()
+
+COMBINATIONS_7C5 = np.array([
+    [0,1,2,3,4], [0,1,2,3,5], [0,1,2,3,6],
+    [0,1,2,4,5], [0,1,2,4,6], [0,1,2,5,6],
+    [0,1,3,4,5], [0,1,3,4,6], [0,1,3,5,6],
+    [0,1,4,5,6], [0,2,3,4,5], [0,2,3,4,6],
+    [0,2,3,5,6], [0,2,4,5,6], [0,3,4,5,6],
+    [1,2,3,4,5], [1,2,3,4,6], [1,2,3,5,6],
+    [1,2,4,5,6], [1,3,4,5,6], [2,3,4,5,6]
+], dtype=np.uint8)
+
+@njit(cache=True)
+def evaluate_5card(five_cards):
+    # Packed strength of exactly five cards (see pack_strength) as a uint32,
+    # built from 13-bit rank masks without allocating.
+    seen1 = seen2 = seen3 = seen4 = 0
+    suits = 0
+    for i in range(5):
+        card = np.int64(five_cards[i])
+        bit = np.int64(1) << (card >> 2)
+        seen4 |= seen3 & bit
+        seen3 |= seen2 & bit
+        seen2 |= seen1 & bit
+        seen1 |= bit
+        suits |= np.int64(1) << (card & 3)
+    # Ranks held exactly four, three, two and one times.
+    quads = seen4
+    trips = seen3 & ~seen4
+    pairs = seen2 & ~seen3
+    singles = seen1 & ~seen2
+    flush = (suits & (suits - 1)) == 0
+    run = singles & (singles >> 1) & (singles >> 2) & (singles >> 3) & (singles >> 4)
+    wheel = singles == 0x100f
+    straight = run != 0 or wheel
+
+    # Kickers: rank groups by count, then rank, high to low, one nibble each.
+    kickers = 0
+    shift = 16
+    for mask in (quads, trips, pairs, singles):
+        for r in range(12, -1, -1):
+            if (mask >> r) & 1:
+                kickers |= np.int64(r) << shift
+                shift -= 4
+    if straight:
+        # Only the top card counts: the highest single, or the five in a wheel.
+        kickers = np.int64(3) << 16 if wheel else kickers & (0xf << 16)
+
+    if straight and flush:
+        category = 8
+    elif quads:
+        category = 7
+    elif trips and pairs:
+        category = 6
+    elif flush:
+        category = 5
+    elif straight:
+        category = 4
+    elif trips:
+        category = 3
+    elif pairs & (pairs - 1):
+        category = 2
+    elif pairs:
+        category = 1
+    else:
+        category = 0
+    return np.uint32((category << 20) | kickers)
+
+# Hand strengths are single integers: category << 20 followed by up to five
+# 4-bit rank nibbles, i.e. the evaluate_5card tuple packed left-aligned.
+def pack_strength(strength):
+    score = strength[0] << 20
+    for i, rank in enumerate(strength[1:]):
+        score |= int(rank) << (16 - 4 * i)
+    return score
+
+def _straight_high(mask):
+    for high in range(12, 3, -1):
+        if (mask >> (high - 4)) & 0x1f == 0x1f:
+            return high
+    if mask & 0x100f == 0x100f:
+        return 3
+    return -1
+
+def _flush_strength(mask):
+    if bin(mask).count('1') < 5:
+        return 0
+    high = _straight_high(mask)
+    if high >= 0:
+        return pack_strength((8, high))
+    ranks = [r for r in range(12, -1, -1) if mask >> r & 1]
+    return pack_strength((5, *ranks[:5]))
+
+def _rank_strength(counts):
+    desc = [r for r in range(12, -1, -1) if counts[r]]
+    quads = [r for r in desc if counts[r] >= 4]
+    trips = [r for r in desc if counts[r] >= 3]
+    pairs = [r for r in desc if counts[r] >= 2]
+    if quads:
+        kickers = [r for r in desc if r != quads[0]]
+        return pack_strength((7, quads[0], *kickers[:1]))
+    if trips and len(pairs) >= 2:
+        pair = [r for r in pairs if r != trips[0]][0]
+        return pack_strength((6, trips[0], pair))
+    high = _straight_high(sum(1 << r for r in desc))
+    if high >= 0:
+        return pack_strength((4, high))
+    if trips:
+        kickers = [r for r in desc if r != trips[0]]
+        return pack_strength((3, trips[0], *kickers[:2]))
+    if len(pairs) >= 2:
+        kickers = [r for r in desc if r not in pairs[:2]]
+        return pack_strength((2, pairs[0], pairs[1], *kickers[:1]))
+    if pairs:
+        kickers = [r for r in desc if r != pairs[0]]
+        return pack_strength((1, pairs[0], *kickers[:3]))
+    return pack_strength((0, *desc[:5]))
+
+def _rank_offsets():
+    # below[n, s]: rank-count vectors of length n (each count 0..4) summing to <= s.
+    # Ranking vectors lexicographically with these gives a minimal perfect hash
+    # over every rank multiset of up to 7 cards.
+    below = np.zeros((14, 8), dtype=np.int64)
+    below[0, :] = 1
+    for n in range(1, 14):
+        for s in range(8):
+            below[n, s] = sum(below[n - 1, s - d] for d in range(min(4, s) + 1))
+    offsets = np.zeros((13, 5, 8), dtype=np.int32)
+    for r in range(13):
+        for q in range(5):
+            for s in range(8):
+                offsets[r, q, s] = sum(below[12 - r, s - d] for d in range(min(q, s + 1)))
+    return offsets, int(below[13, 7])
+
+def _rank_vectors(length, room):
+    if length == 0:
+        yield ()
+        return
+    for q in range(min(4, room) + 1):
+        for rest in _rank_vectors(length - 1, room - q):
+            yield (q,) + rest
+
+def build_rank_tables():
+    offsets, size = _rank_offsets()
+    rank_table = np.zeros(size, dtype=np.int32)
+    for counts in _rank_vectors(13, 7):
+        index, room = 0, 7
+        for r in range(13):
+            index += offsets[r, counts[r], room]
+            room -= counts[r]
+        rank_table[index] = _rank_strength(counts)
+    flush_table = np.array([_flush_strength(m) for m in range(1 << 13)], dtype=np.int32)
+    return offsets, rank_table, flush_table
+
+def load_rank_tables(path=RANK_TABLE_PATH):
+    try:
+        with np.load(path) as data:
+            if int(data['version']) == RANK_TABLE_VERSION:
+                return data['offsets'], data['rank_table'], data['flush_table']
+    except (OSError, KeyError, ValueError):
+        pass
+    offsets, rank_table, flush_table = build_rank_tables()
+    try:
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, version=RANK_TABLE_VERSION, offsets=offsets,
+                 rank_table=rank_table, flush_table=flush_table)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
+    return offsets, rank_table, flush_table
+
+RANK_OFFSETS, RANK_TABLE, FLUSH_TABLE = load_rank_tables()
+
+@njit(cache=True)
+def _suited_flush(cards, suit):
+    # Flush strength of one suit from a multi-deck hand holding duplicate
+    # suited cards: the top five suited cards, duplicates included.
+    strength = 5 << 20
+    shift = 16
+    for r in range(12, -1, -1):
+        card = 4 * r + suit
+        for i in range(len(cards)):
+            if cards[i] == card and shift >= 0:
+                strength |= r << shift
+                shift -= 4
+    return strength
+
+@njit(cache=True)
+def evaluate_7hand(seven_cards):
+    # Works for any 5-7 cards, duplicates included (multi-deck shoes); counts
+    # past four of a rank are capped.
+    rank_key = 0
+    suit_masks = 0
+    suit_dupes = 0
+    suit_counts = 0
+    for i in range(len(seven_cards)):
+        card = np.int64(seven_cards[i])
+        rank_key += np.int64(1) << (3 * (card >> 2))
+        bit = np.int64(1) << (16 * (card & 3) + (card >> 2))
+        suit_dupes |= suit_masks & bit
+        suit_masks |= bit
+        suit_counts += np.int64(1) << (4 * (card & 3))
+    index = 0
+    room = 7
+    for r in range(13):
+        q = (rank_key >> (3 * r)) & 7
+        if q == 0:
+            continue
+        if q > 4:
+            q = 4
+        index += RANK_OFFSETS[r, q, room]
+        room -= q
+    strength = RANK_TABLE[index]
+    for s in range(4):
+        flush = FLUSH_TABLE[(suit_masks >> (16 * s)) & 0x1fff]
+        if ((suit_dupes >> (16 * s)) & 0x1fff and ((suit_counts >> (4 * s)) & 0xf) >= 5
+                and (flush >> 20) != 8):
+            # A duplicated suited card: the rank mask undercounts the suit,
+            # and the best flush may use both copies.
+            flush = _suited_flush(seven_cards, s)
+        if flush > strength:
+            strength = flush
+    return strength
+
+def reference_evaluate_5card(five_cards):
+    # The original tuple evaluator, kept as the oracle for evaluate_5card.
+    ranks = (five_cards // 4).astype(np.int32)
+    suits = (five_cards % 4).astype(np.int32)
+    rank_counts = np.zeros(13, dtype=np.int32)
+    suit_counts = np.zeros(4, dtype=np.int32)
+    for i in range(5):
+        rank_counts[ranks[i]] += 1
+        suit_counts[suits[i]] += 1
+    flush = np.any(suit_counts >= 5)
+    if flush:
+        suit = np.argmax(suit_counts)
+        flush_ranks = ranks[suits == suit]
+        if len(flush_ranks) < 5:
+            flush = False
+    unique_ranks = np.unique(ranks)
+    straight = False
+    if len(unique_ranks) >= 5:
+        sorted_ranks = np.sort(unique_ranks)
+        for i in range(len(sorted_ranks)-4):
+            if sorted_ranks[i+4] - sorted_ranks[i] == 4:
+                straight = True
+                high = sorted_ranks[i+4]
+        if not straight and sorted_ranks[-1] == 12 and np.all(sorted_ranks[:4] == np.arange(4)):
+            straight = True
+            high = 3
+    if straight and flush:
+        return (8, high)
+    if np.any(rank_counts == 4):
+        quad_rank = np.argmax(rank_counts)
+        kicker = np.max(ranks[ranks != quad_rank])
+        return (7, quad_rank, kicker)
+    if np.any(rank_counts == 3) and np.any(rank_counts == 2):
+        trips_rank = np.argmax(rank_counts == 3)
+        pair_rank = np.argmax(rank_counts == 2)
+        return (6, trips_rank, pair_rank)
+    if flush:
+        sorted_flush = np.sort(flush_ranks)[::-1][:5]
+        return (5, sorted_flush[0], sorted_flush[1], sorted_flush[2], sorted_flush[3], sorted_flush[4])
+    if straight:
+        return (4, high)
+    if np.any(rank_counts == 3):
+        trips_rank = np.argmax(rank_counts)
+        kickers = np.sort(ranks[ranks != trips_rank])[::-1][:2]
+        return (3, trips_rank, kickers[0], kickers[1])
+    if np.sum(rank_counts == 2) >= 2:
+        pairs = np.where(rank_counts == 2)[0][::-1]
+        kicker = np.max(ranks[~np.isin(ranks, pairs[:2])])
+        return (2, pairs[0], pairs[1], kicker)
+    if np.any(rank_counts == 2):
+        pair_rank = np.argmax(rank_counts)
+        kickers = np.sort(ranks[ranks != pair_rank])[::-1][:3]
+        return (1, pair_rank, kickers[0], kickers[1], kickers[2])
+    high_cards = np.sort(ranks)[::-1][:5]
+    return (0, high_cards[0], high_cards[1], high_cards[2], high_cards[3], high_cards[4])
+
+def reference_evaluate_7hand(seven_cards):
+    cards = np.asarray(seven_cards)
+    return max(pack_strength(reference_evaluate_5card(cards[combo])) for combo in COMBINATIONS_7C5)
+
+def verify_evaluator(samples=100000, seed=0, num_decks=1):
+    shoe = np.repeat(np.arange(52, dtype=np.uint8), num_decks)
+    rng = np.random.default_rng(seed)
+    mismatches = []
+    for _ in range(samples):
+        hand = rng.choice(shoe, size=7, replace=False)
+        expected = reference_evaluate_7hand(hand)
+        got = evaluate_7hand(hand)
+        if got != expected:
+            mismatches.append((hand.tolist(), expected, int(got)))
+    return mismatches
+
+@njit(cache=True)
+def _best_of_21(cards):
+    five = np.empty(5, dtype=np.int32)
+    best = np.uint32(0)
+    for c in range(21):
+        for j in range(5):
+            five[j] = cards[COMBINATIONS_7C5[c, j]]
+        strength = evaluate_5card(five)
+        if strength > best:
+            best = strength
+    return best
+
+@njit(cache=True)
+def _count_evaluator_mismatches(samples, seed):
+    deck = np.arange(52, dtype=np.int32)
+    state = _stream_state(seed, 0)
+    mismatches = 0
+    for _ in range(samples):
+        state = _draw_cards(deck, 7, state)
+        if evaluate_7hand(deck[:7]) != _best_of_21(deck[:7]):
+            mismatches += 1
+    return mismatches
+
+def count_evaluator_mismatches(samples=1000000, seed=0):
+    # evaluate_7hand against the best of its 21 five-card subsets under
+    # evaluate_5card, compiled, so millions of hands take seconds. Single
+    # deck only: evaluate_5card assumes distinct cards; verify_evaluator
+    # covers shoes.
+    return int(_count_evaluator_mismatches(samples, seed))
+
+def verify_evaluate_5card(samples=None, seed=0):
+    # Every five-card hand against the tuple oracle (a few minutes), or
+    # samples random ones.
+    if samples is None:
+        hands = itertools.combinations(range(52), 5)
+    else:
+        rng = np.random.default_rng(seed)
+        hands = (rng.choice(52, size=5, replace=False) for _ in range(samples))
+    mismatches = []
+    for combo in hands:
+        hand = np.array(combo, dtype=np.uint8)
+        expected = pack_strength(reference_evaluate_5card(hand))
+        got = evaluate_5card(hand)
+        if got != expected:
+            mismatches.append((hand.tolist(), expected, int(got)))
+    return mismatches
+
+# Simulations are split into fixed-size chunks, each with its own deck buffer,
+# RNG stream and counters, so results depend only on the seed, not the thread count.
+MC_CHUNK = 4096
+GOLDEN_GAMMA = np.uint64(0x9E3779B97F4A7C15)
+
+@njit(cache=True)
+def _splitmix64(state):
+    state = state + GOLDEN_GAMMA
+    z = state
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return state, z ^ (z >> np.uint64(31))
+
+@njit(cache=True)
+def _stream_state(seed, stream):
+    _, state = _splitmix64(np.uint64(seed) + np.uint64(stream) * GOLDEN_GAMMA)
+    return state
+
+@njit(cache=True)
+def _draw_cards(deck, n_draw, state):
+    # Partial Fisher-Yates: only the first n_draw slots are shuffled.
+    n = len(deck)
+    for j in range(n_draw):
+        state, x = _splitmix64(state)
+        k = j + np.int64(((x >> np.uint64(32)) * np.uint64(n - j)) >> np.uint64(32))
+        tmp = deck[j]
+        deck[j] = deck[k]
+        deck[k] = tmp
+    return state
+
+@njit(cache=True)
+def _live_deck(player_hand, community, num_decks=1):
+    remaining = np.full(52, num_decks, dtype=np.int64)
+    for c in player_hand:
+        remaining[c] -= 1
+    for c in community:
+        remaining[c] -= 1
+    deck = np.empty(remaining.sum(), dtype=np.int32)
+    n = 0
+    for c in range(52):
+        for _ in range(remaining[c]):
+            deck[n] = c
+            n += 1
+    return deck
+
+# Per-simulation totals: pairwise wins, ties and losses against each opponent
+# (as calculate_win_percentage counts them) and hero's share of the pot.
+@njit(cache=True)
+def _simulate_chunk(deck, player_hand, community, n_sims, num_opponents, state, out):
+    n_known = len(community)
+    n_comm_needed = 5 - n_known
+    player_full = np.empty(7, dtype=np.int32)
+    opp_full = np.empty(7, dtype=np.int32)
+    player_full[0] = player_hand[0]
+    player_full[1] = player_hand[1]
+    for j in range(n_known):
+        player_full[2 + j] = community[j]
+        opp_full[2 + j] = community[j]
+    wins = 0
+    ties = 0
+    losses = 0
+    share = 0.0
+    for _ in range(n_sims):
+        state = _draw_cards(deck, n_comm_needed + 2 * num_opponents, state)
+        for j in range(n_comm_needed):
+            player_full[2 + n_known + j] = deck[j]
+            opp_full[2 + n_known + j] = deck[j]
+        player_strength = evaluate_7hand(player_full)
+        beaten = False
+        split = 1
+        for k in range(num_opponents):
+            opp_full[0] = deck[n_comm_needed + 2 * k]
+            opp_full[1] = deck[n_comm_needed + 2 * k + 1]
+            opp_strength = evaluate_7hand(opp_full)
+            if player_strength > opp_strength:
+                wins += 1
+            elif player_strength == opp_strength:
+                ties += 1
+                split += 1
+            else:
+                losses += 1
+                beaten = True
+        if not beaten:
+            share += 1.0 / split
+    out[0] = wins
+    out[1] = ties
+    out[2] = losses
+    out[3] = share
+
+@njit(parallel=True, nogil=True, cache=True)
+def monte_carlo_sim(player_hand, community, num_sims, seed=0, num_opponents=1, num_decks=1):
+    deck = _live_deck(player_hand, community, num_decks)
+    n_chunks = (num_sims + MC_CHUNK - 1) // MC_CHUNK
+    results = np.zeros((n_chunks, 4), dtype=np.float64)
+    for chunk in prange(n_chunks):
+        n_sims = min(num_sims, (chunk + 1) * MC_CHUNK) - chunk * MC_CHUNK
+        _simulate_chunk(deck.copy(), player_hand, community, n_sims, num_opponents,
+                        _stream_state(seed, chunk), results[chunk])
+    return results.sum(axis=0)
+
+@njit(parallel=True, nogil=True, cache=True)
+def batch_monte_carlo_sim(hands, boards, num_sims, seed=0, num_opponents=1, num_decks=1):
+    # hands is (n, 2) and boards (n, 5) padded with -1; one work item per
+    # (query, chunk) so small batches still spread across threads.
+    n_queries = len(hands)
+    n_chunks = (num_sims + MC_CHUNK - 1) // MC_CHUNK
+    results = np.zeros((n_queries, n_chunks, 4), dtype=np.float64)
+    for item in prange(n_queries * n_chunks):
+        q = item // n_chunks
+        chunk = item % n_chunks
+        n_known = 0
+        while n_known < boards.shape[1] and boards[q, n_known] >= 0:
+            n_known += 1
+        community = boards[q, :n_known]
+        deck = _live_deck(hands[q], community, num_decks)
+        n_sims = min(num_sims, (chunk + 1) * MC_CHUNK) - chunk * MC_CHUNK
+        _simulate_chunk(deck, hands[q], community, n_sims, num_opponents,
+                        _stream_state(_stream_state(seed, q), chunk), results[q, chunk])
+    return results.sum(axis=1)
+
+@njit(parallel=True, nogil=True, cache=True)
+def exact_enum_sim(player_hand, community, deck, runouts, weights):
+    # Every (runout, opponent hole cards) pair of the remaining shoe; runouts
+    # are suit-isomorphism class representatives given as positions in deck.
+    n_known = len(community)
+    n_runout = runouts.shape[1]
+    n_deck = len(deck)
+    results = np.zeros((len(runouts), 3), dtype=np.int64)
+    for r in prange(len(runouts)):
+        used = np.zeros(n_deck, dtype=np.bool_)
+        player_full = np.empty(7, dtype=np.int32)
+        opp_full = np.empty(7, dtype=np.int32)
+        player_full[:2] = player_hand
+        for j in range(n_known):
+            player_full[2 + j] = community[j]
+            opp_full[2 + j] = community[j]
+        for j in range(n_runout):
+            used[runouts[r, j]] = True
+            player_full[2 + n_known + j] = deck[runouts[r, j]]
+            opp_full[2 + n_known + j] = deck[runouts[r, j]]
+        player_strength = evaluate_7hand(player_full)
+        wins = 0
+        ties = 0
+        losses = 0
+        for a in range(n_deck):
+            if used[a]:
+                continue
+            opp_full[0] = deck[a]
+            for b in range(a + 1, n_deck):
+                if used[b]:
+                    continue
+                opp_full[1] = deck[b]
+                opp_strength = evaluate_7hand(opp_full)
+                if player_strength > opp_strength:
+                    wins += 1
+                elif player_strength == opp_strength:
+                    ties += 1
+                else:
+                    losses += 1
+        results[r, 0] = wins * weights[r]
+        results[r, 1] = ties * weights[r]
+        results[r, 2] = losses * weights[r]
+    return results.sum(axis=0)
+
+SUIT_PERMUTATIONS = list(itertools.permutations(range(4)))
+
+def _permute_suits(cards, perm):
+    return tuple(sorted(c - c % 4 + perm[c % 4] for c in cards))
+
+def suit_stabilizer(cards):
+    known = tuple(sorted(cards))
+    return [p for p in SUIT_PERMUTATIONS if _permute_suits(known, p) == known]
+
+def canonical_runouts(deck, n_cards, known_cards):
+    group = suit_stabilizer(known_cards)
+    classes = {}
+    for combo in itertools.combinations(range(len(deck)), n_cards):
+        cards = tuple(sorted(int(deck[i]) for i in combo))
+        if len(group) > 1:
+            cards = min(_permute_suits(cards, p) for p in group)
+        if cards in classes:
+            classes[cards][1] += 1
+        else:
+            classes[cards] = [combo, 1]
+    runouts = np.array([combo for combo, _ in classes.values()], dtype=np.int32).reshape(len(classes), n_cards)
+    weights = np.array([count for _, count in classes.values()], dtype=np.int64)
+    return runouts, weights
+
+def exact_state_count(community_cards=None, num_decks=1):
+    # Win and tie rates are pairwise, so by symmetry one opponent's hole cards
+    # cover any number of opponents.
+    n_comm = len(community_cards) if community_cards else 0
+    n_deck = 52*num_decks - 2 - n_comm
+    n_runout = 5 - n_comm
+    return math.comb(n_deck, n_runout) * math.comb(n_deck - n_runout, 2)
+
+def exact_equity(player_hand, community_cards=None, num_decks=1, num_opponents=1):
+    community = list(community_cards) if community_cards else []
+    _check_deal(player_hand, community, num_decks, num_opponents)
+    ph = np.array([card_to_index(c) for c in player_hand], dtype=np.int32)
+    comm = np.array([card_to_index(c) for c in community], dtype=np.int32)
+    deck = _live_deck(ph, comm, num_decks)
+    runouts, weights = canonical_runouts(deck, 5 - len(community), ph.tolist() + comm.tolist())
+    with KERNEL_LOCK:
+        wins, ties, losses = exact_enum_sim(ph, comm, deck, runouts, weights)
+    total = wins + ties + losses
+    return wins/total*100, ties/total*100
+
+CARD_STRINGS = [f"{r}{s}" for r in '23456789TJQKA' for s in 'shdc']
+
+def calculate_win_percentage(player_hand, community_cards=None, simulations=100000, num_decks=1, num_opponents=1):
+    # pokerkit is only imported by this backend; importing it costs more than
+    # loading every cached numba kernel.
+    from pokerkit import HandUtilities
+
+    community = list(community_cards) if community_cards else []
+    _check_deal(player_hand, community, num_decks, num_opponents)
+    needed_community = 5 - len(community)
+    needed = 2*num_opponents + needed_community
+    known = [card_to_index(c) for c in list(player_hand) + community]
+    remaining = np.full(52, num_decks, dtype=np.int64)
+    np.subtract.at(remaining, known, 1)
+    deck = np.repeat(np.arange(52), remaining).tolist()
+    n = len(deck)
+    # On the turn and river the same seven cards come round again and again,
+    # so ranks are memoised per call by sorted card indices. Earlier streets
+    # almost never repeat, and the memo would only grow (100MB+ preflop).
+    ranks = {}
+
+    def rank(cards):
+        key = tuple(sorted(cards))
+        value = ranks.get(key)
+        if value is None:
+            value = HandUtilities.get_rank(''.join(CARD_STRINGS[c] for c in key))
+            if needed_community <= 1:
+                ranks[key] = value
+        return value
+
+    randbelow = random.randrange
+    wins = 0
+    ties = 0
+    for _ in range(simulations):
+        for j in range(needed):
+            k = j + randbelow(n - j)
+            deck[j], deck[k] = deck[k], deck[j]
+        board = known[2:] + deck[:needed_community]
+        player_rank = rank(known[:2] + board)
+        for k in range(num_opponents):
+            opp_cards = deck[needed_community + 2*k:needed_community + 2*k + 2]
+            result = HandUtilities.compare_ranks(player_rank, rank(opp_cards + board))
+            if result == 1:
+                wins += 1
+            elif result == 0:
+                ties += 1
+    total = simulations * num_opponents
+    return (wins/total*100, ties/total*100)
+
+def card_to_index(card_str):
+    rank_order = '23456789TJQKA'
+    suit_order = {'s':0, 'h':1, 'd':2, 'c':3}
+    return rank_order.index(card_str[0].upper()) * 4 + suit_order[card_str[1].lower()]
+
+def index_to_card(index):
+    ranks = '23456789TJQKA'
+    suits = 'shdc'
+    return f"{ranks[index//4]}{suits[index%4]}"
+
+def _check_deal(player_hand, community, num_decks, num_opponents):
+    if len(player_hand) != 2:
+        raise ValueError("player must have exactly 2 cards")
+    if len(community) > 5:
+        raise ValueError("too many community cards")
+    known_cards = Counter(list(player_hand) + list(community))
+    if any(v > num_decks for v in known_cards.values()):
+        raise ValueError("duplicate cards exceed deck count")
+    needed = 2*num_opponents + 5 - len(community)
+    available = 52*num_decks - len(player_hand) - len(community)
+    if available < needed:
+        raise ValueError(f"need {needed} cards but only {available} available")
+
+def simulate_equity(player_hand, community_cards=None, simulations=100000, num_decks=1, num_opponents=1, seed=None, exact=None):
+    with instrumentation.timer('equity_prep_seconds', 'Deal validation and card encoding'):
+        community = list(community_cards) if community_cards else []
+        _check_deal(player_hand, community, num_decks, num_opponents)
+        if exact is None:
+            exact = num_opponents == 1 and exact_state_count(community, num_decks) <= simulations
+        ph = np.array([card_to_index(c) for c in player_hand], dtype=np.int32)
+        comm = np.array([card_to_index(c) for c in community], dtype=np.int32)
+    if exact:
+        if num_opponents != 1:
+            raise ValueError("exact pot share is only enumerated heads-up")
+        with instrumentation.timer('equity_exact_seconds', 'Exact enumeration'):
+            win, tie = exact_equity(player_hand, community, num_decks, num_opponents)
+        return win, tie, win + tie/2
+    if seed is None:
+        seed = random.getrandbits(63)
+    with instrumentation.timer('equity_simulation_seconds', 'Monte Carlo kernel'), KERNEL_LOCK:
+        wins, ties, _, share = monte_carlo_sim(ph, comm, simulations, seed, num_opponents, num_decks)
+    instrumentation.counter('equity_simulations_total', 'Monte Carlo deals simulated').inc(simulations)
+    total = simulations * num_opponents
+    return wins/total*100, ties/total*100, share/simulations*100
+
+# Preflop classes: 13x13 grid with pairs on the diagonal, suited hands above
+# it (high*13 + low) and offsuit below (low*13 + high). Multi-deck shoes add
+# 13 identical-card classes (e.g. AsAs) after the usual 169.
+PREFLOP_CLASSES = 169 + 13
+PREFLOP_MAX_OPPONENTS = 9
+PREFLOP_HEADER = struct.Struct('<4sHHHHI')
+PREFLOP_MAGIC = b'PGPF'
+
+def preflop_class(player_hand):
+    a, b = (card_to_index(c) for c in player_hand)
+    if a == b:
+        return 169 + a // 4
+    high, low = max(a // 4, b // 4), min(a // 4, b // 4)
+    if a % 4 == b % 4:
+        return high*13 + low
+    return low*13 + high
+
+def preflop_class_hand(index):
+    ranks = '23456789TJQKA'
+    if index >= 169:
+        return [f"{ranks[index - 169]}s", f"{ranks[index - 169]}s"]
+    row, col = divmod(index, 13)
+    if row > col:
+        return [f"{ranks[row]}s", f"{ranks[col]}s"]
+    return [f"{ranks[max(row, col)]}s", f"{ranks[min(row, col)]}h"]
+
+def build_preflop_table(path=PREFLOP_TABLE_PATH, simulations=200000, max_decks=2, max_opponents=PREFLOP_MAX_OPPONENTS, seed=0):
+    table = np.full((max_decks, max_opponents, PREFLOP_CLASSES, 3), np.nan, dtype='<f4')
+    for d in range(max_decks):
+        for n in range(max_opponents):
+            for index in range(PREFLOP_CLASSES):
+                if index >= 169 and d == 0:
+                    continue
+                table[d, n, index] = simulate_equity(
+                    preflop_class_hand(index), None, simulations, d + 1, n + 1,
+                    seed=seed + (d*max_opponents + n)*PREFLOP_CLASSES + index, exact=False
+                )
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(PREFLOP_HEADER.pack(PREFLOP_MAGIC, PREFLOP_TABLE_VERSION, max_decks,
+                                    max_opponents, PREFLOP_CLASSES, simulations))
+        f.write(table.tobytes())
+    os.replace(tmp_path, path)
+    return table
+
+def load_preflop_table(path=PREFLOP_TABLE_PATH):
+    try:
+        with open(path, 'rb') as f:
+            magic, version, max_decks, max_opponents, n_classes, simulations = \
+                PREFLOP_HEADER.unpack(f.read(PREFLOP_HEADER.size))
+    except (OSError, struct.error):
+        return None
+    if magic != PREFLOP_MAGIC or version != PREFLOP_TABLE_VERSION or n_classes != PREFLOP_CLASSES:
+        return None
+    table = np.memmap(path, dtype='<f4', mode='r', offset=PREFLOP_HEADER.size,
+                      shape=(max_decks, max_opponents, n_classes, 3))
+    return table, simulations
+
+PREFLOP_TABLE = load_preflop_table()
+
+def preflop_lookup(player_hand, num_decks=1, num_opponents=1, simulations=0):
+    # (win, tie, share) in percent, or None when the table can't answer.
+    if PREFLOP_TABLE is None:
+        return None
+    table, table_sims = PREFLOP_TABLE
+    if simulations > table_sims or num_decks > table.shape[0] or num_opponents > table.shape[1]:
+        return None
+    entry = table[num_decks - 1, num_opponents - 1, preflop_class(player_hand)]
+    if np.isnan(entry[0]):
+        return None
+    return float(entry[0]), float(entry[1]), float(entry[2])
+
+def canonical_key(player_hand, community_cards=None):
+    # Smallest (hand, board) over all suit relabellings, so AsKs/Qs7h2d and
+    # AhKh/Qh7s2d share a key. Card order within hand and board is ignored.
+    hand = [card_to_index(c) for c in player_hand]
+    board = [card_to_index(c) for c in community_cards] if community_cards else []
+    return min((_permute_suits(hand, p), _permute_suits(board, p)) for p in SUIT_PERMUTATIONS)
+
+class EquityCache:
+    def __init__(self, maxsize=65536):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'size': len(self.entries),
+                'maxsize': self.maxsize,
+            }
+
+EQUITY_CACHE = EquityCache()
+
+def calculate_odds(player_hand, community_cards=None, simulations=100000, num_decks=1, num_opponents=1, use_pokerkit=True, seed=None, exact=None, use_cache=True):
+    # Seeded calls bypass the cache so they stay reproducible.
+    if not use_cache or seed is not None:
+        return _calculate_odds(player_hand, community_cards, simulations, num_decks, num_opponents, use_pokerkit, seed, exact)
+    key = (canonical_key(player_hand, community_cards), num_opponents, num_decks, simulations, exact, use_pokerkit)
+    result = EQUITY_CACHE.get(key)
+    if result is None:
+        result = _calculate_odds(player_hand, community_cards, simulations, num_decks, num_opponents, use_pokerkit, seed, exact)
+        EQUITY_CACHE.put(key, result)
+    return result
+
+def _calculate_odds(player_hand, community_cards, simulations, num_decks, num_opponents, use_pokerkit, seed, exact):
+    if not community_cards and not exact:
+        _check_deal(player_hand, [], num_decks, num_opponents)
+        cached = preflop_lookup(player_hand, num_decks, num_opponents, simulations)
+        if cached is not None:
+            return cached[0], cached[1]
+    if exact is None:
+        exact = exact_state_count(community_cards, num_decks) <= simulations
+    if exact:
+        return exact_equity(player_hand, community_cards, num_decks, num_opponents)
+    if use_pokerkit:
+        return calculate_win_percentage(
+            player_hand,
+            community_cards,
+            simulations,
+            num_decks,
+            num_opponents
+        )
+    else:
+        win, tie, _ = simulate_equity(
+            player_hand,
+            community_cards,
+            simulations,
+            num_decks,
+            num_opponents,
+            seed,
+            exact=False
+        )
+        return win, tie
+
+def _encode_cards(cards, width):
+    if cards is None:
+        return None
+    if isinstance(cards, np.ndarray) and cards.dtype.kind in 'iu':
+        encoded = np.full((len(cards), width), -1, dtype=np.int32)
+        encoded[:, :cards.shape[1]] = cards
+        return encoded
+    encoded = np.full((len(cards), width), -1, dtype=np.int32)
+    for i, row in enumerate(cards):
+        for j, card in enumerate(row or []):
+            encoded[i, j] = card_to_index(card) if isinstance(card, str) else card
+    return encoded
+
+def calculate_odds_batch(hands, boards=None, simulations=10000, num_decks=1, num_opponents=1, seed=None):
+    # hands: (n, 2) card indices or lists of card strings; boards likewise with
+    # up to 5 cards per row (index rows padded with -1). Returns win and tie
+    # percentages as arrays.
+    hands = _encode_cards(hands, 2)
+    if boards is None:
+        boards = np.full((len(hands), 5), -1, dtype=np.int32)
+    else:
+        boards = _encode_cards(boards, 5)
+    if len(boards) != len(hands):
+        raise ValueError("need one board per hand")
+    if (hands < 0).any() or (hands > 51).any() or (boards > 51).any():
+        raise ValueError("player must have exactly 2 valid cards")
+    if ((boards[:, 1:] >= 0) & (boards[:, :-1] < 0)).any():
+        raise ValueError("board padding must come after the cards")
+    known = np.concatenate((hands, boards), axis=1)
+    counts = np.zeros((len(known), 53), dtype=np.int32)
+    np.add.at(counts, (np.arange(len(known))[:, None], np.where(known >= 0, known, 52)), 1)
+    if (counts[:, :52] > num_decks).any():
+        raise ValueError("duplicate cards exceed deck count")
+    if 52*num_decks - 7 < 2*num_opponents:
+        raise ValueError(f"need {2*num_opponents + 7} cards but only {52*num_decks} available")
+    if seed is None:
+        seed = random.getrandbits(63)
+    with KERNEL_LOCK:
+        results = batch_monte_carlo_sim(hands, boards, simulations, seed, num_opponents, num_decks)
+    total = simulations * num_opponents
+    return results[:, 0] / total * 100, results[:, 1] / total * 100
+
+RANGE_RANKS = '23456789TJQKA'
+
+def _rank_combos(high, low, suited):
+    # high and low are rank indices; suited None means both kinds.
+    combos = []
+    for s1 in range(4):
+        for s2 in range(4):
+            a, b = high*4 + s1, low*4 + s2
+            if high == low:
+                if s1 < s2:
+                    combos.append((b, a))
+            elif suited is None or suited == (s1 == s2):
+                combos.append((a, b))
+    return combos
+
+def _range_token(token):
+    if len(token) == 4 and token[1] in 'shdcSHDC':
+        a, b = card_to_index(token[:2]), card_to_index(token[2:])
+        return [(max(a, b), min(a, b))]
+    plus = token.endswith('+')
+    token = token.rstrip('+')
+    if '-' in token:
+        first, last = token.split('-')
+        r1, r2 = RANGE_RANKS.index(first[0].upper()), RANGE_RANKS.index(first[1].upper())
+        r3, r4 = RANGE_RANKS.index(last[0].upper()), RANGE_RANKS.index(last[1].upper())
+        suited = {'s': True, 'o': False}.get(first[2:].lower())
+        if r1 == r2:
+            return [c for r in range(min(r1, r3), max(r1, r3) + 1) for c in _rank_combos(r, r, None)]
+        return [c for low in range(min(r2, r4), max(r2, r4) + 1) for c in _rank_combos(r1, low, suited)]
+    high, low = RANGE_RANKS.index(token[0].upper()), RANGE_RANKS.index(token[1].upper())
+    high, low = max(high, low), min(high, low)
+    suited = {'s': True, 'o': False}.get(token[2:].lower())
+    if high == low:
+        return [c for r in range(high, 13 if plus else high + 1) for c in _rank_combos(r, r, None)]
+    return [c for k in range(low, high if plus else low + 1) for c in _rank_combos(high, k, suited)]
+
+def parse_range(opponent_range):
+    # Standard notation ("TT+, AJs+, KQo, A5s-A2s, AsKs:0.5") or weighted combos
+    # as {combo: weight} / [(combo, weight)], combos being "AsKs" or ['As', 'Ks'].
+    # Returns (combos, weights) with combos as (n, 2) card indices.
+    weighted = {}
+    if isinstance(opponent_range, str):
+        for token in opponent_range.replace(' ', '').split(','):
+            if not token:
+                continue
+            token, _, weight = token.partition(':')
+            for combo in _range_token(token):
+                weighted[combo] = float(weight) if weight else 1.0
+    else:
+        items = opponent_range.items() if isinstance(opponent_range, dict) else opponent_range
+        for combo, weight in items:
+            cards = [combo[:2], combo[2:]] if isinstance(combo, str) else list(combo)
+            a, b = (card_to_index(c) if isinstance(c, str) else int(c) for c in cards)
+            weighted[(max(a, b), min(a, b))] = float(weight)
+    combos = np.array(list(weighted.keys()), dtype=np.int32).reshape(len(weighted), 2)
+    weights = np.array(list(weighted.values()), dtype=np.float64)
+    return combos, weights
+
+@njit(parallel=True, nogil=True, cache=True)
+def _sample_runouts(deck, n_cards, n_runouts, seed):
+    runouts = np.empty((n_runouts, n_cards), dtype=np.int32)
+    n_chunks = (n_runouts + MC_CHUNK - 1) // MC_CHUNK
+    for chunk in prange(n_chunks):
+        local_deck = deck.copy()
+        state = _stream_state(seed, chunk)
+        for r in range(chunk * MC_CHUNK, min(n_runouts, (chunk + 1) * MC_CHUNK)):
+            state = _draw_cards(local_deck, n_cards, state)
+            runouts[r, :] = local_deck[:n_cards]
+    return runouts
+
+@njit(parallel=True, nogil=True, cache=True)
+def range_equity_sim(player_hand, community, combos, runouts):
+    # Wins, ties and losses of hero against each combo over the shared runouts,
+    # skipping runouts that use one of the combo's cards.
+    n_known = len(community)
+    n_runouts, n_cards = runouts.shape
+    hero = np.empty(n_runouts, dtype=np.int32)
+    masks = np.zeros(n_runouts, dtype=np.int64)
+    for r in prange(n_runouts):
+        player_full = np.empty(7, dtype=np.int32)
+        player_full[0] = player_hand[0]
+        player_full[1] = player_hand[1]
+        for j in range(n_known):
+            player_full[2 + j] = community[j]
+        mask = np.int64(0)
+        for j in range(n_cards):
+            player_full[2 + n_known + j] = runouts[r, j]
+            mask |= np.int64(1) << runouts[r, j]
+        hero[r] = evaluate_7hand(player_full)
+        masks[r] = mask
+    results = np.zeros((len(combos), 3), dtype=np.int64)
+    for c in prange(len(combos)):
+        opp_full = np.empty(7, dtype=np.int32)
+        opp_full[0] = combos[c, 0]
+        opp_full[1] = combos[c, 1]
+        for j in range(n_known):
+            opp_full[2 + j] = community[j]
+        combo_mask = (np.int64(1) << combos[c, 0]) | (np.int64(1) << combos[c, 1])
+        for r in range(n_runouts):
+            if masks[r] & combo_mask:
+                continue
+            for j in range(n_cards):
+                opp_full[2 + n_known + j] = runouts[r, j]
+            opp_strength = evaluate_7hand(opp_full)
+            if hero[r] > opp_strength:
+                results[c, 0] += 1
+            elif hero[r] == opp_strength:
+                results[c, 1] += 1
+            else:
+                results[c, 2] += 1
+    return results
+
+RangeEquity = namedtuple('RangeEquity', ['win', 'tie', 'breakdown'])
+
+def hand_vs_range(player_hand, opponent_range, community_cards=None, simulations=5000, seed=None, exact=None):
+    # Single-deck, heads-up. breakdown maps each live combo to (weight, win, tie).
+    community = list(community_cards) if community_cards else []
+    _check_deal(player_hand, community, 1, 1)
+    ph = np.array([card_to_index(c) for c in player_hand], dtype=np.int32)
+    comm = np.array([card_to_index(c) for c in community], dtype=np.int32)
+    if isinstance(opponent_range, tuple) and isinstance(opponent_range[0], np.ndarray):
+        combos, weights = opponent_range
+    else:
+        combos, weights = parse_range(opponent_range)
+    dead = set(ph.tolist()) | set(comm.tolist())
+    live = np.array([a not in dead and b not in dead for a, b in combos.tolist()], dtype=np.bool_)
+    combos, weights = combos[live & (weights > 0)], weights[live & (weights > 0)]
+    if len(combos) == 0:
+        raise ValueError("opponent range has no combos left after card removal")
+    deck = _live_deck(ph, comm, 1)
+    n_cards = 5 - len(community)
+    if exact is None:
+        exact = math.comb(len(deck), n_cards) <= simulations
+    if exact:
+        runouts = np.array(list(itertools.combinations(deck.tolist(), n_cards)), dtype=np.int32)
+        runouts = runouts.reshape(math.comb(len(deck), n_cards), n_cards)
+    else:
+        if seed is None:
+            seed = random.getrandbits(63)
+        with KERNEL_LOCK:
+            runouts = _sample_runouts(deck, n_cards, simulations, seed)
+    with KERNEL_LOCK:
+        results = range_equity_sim(ph, comm, combos, runouts).astype(np.float64)
+    totals = results.sum(axis=1)
+    combo_win = results[:, 0] / totals * 100
+    combo_tie = results[:, 1] / totals * 100
+    win = float(np.dot(weights, combo_win) / weights.sum())
+    tie = float(np.dot(weights, combo_tie) / weights.sum())
+    breakdown = {
+        index_to_card(a) + index_to_card(b): (float(w), float(cw), float(ct))
+        for (a, b), w, cw, ct in zip(combos.tolist(), weights, combo_win, combo_tie)
+    }
+    return RangeEquity(win, tie, breakdown)
+
+def range_vs_range(hero_range, opponent_range, community_cards=None, simulations=2000, seed=None):
+    # breakdown maps each live hero combo to (weight, win, tie) against the
+    # opponent range with that combo's cards removed.
+    hero_combos, hero_weights = parse_range(hero_range)
+    opp = parse_range(opponent_range)
+    dead = set(card_to_index(c) for c in community_cards) if community_cards else set()
+    if seed is None:
+        seed = random.getrandbits(63)
+    breakdown = {}
+    total_weight = win = tie = 0.0
+    for (a, b), weight in zip(hero_combos.tolist(), hero_weights):
+        if a in dead or b in dead or weight <= 0:
+            continue
+        hand = [index_to_card(a), index_to_card(b)]
+        try:
+            result = hand_vs_range(hand, opp, community_cards, simulations, seed + a*52 + b)
+        except ValueError:
+            continue
+        # Weight by how many opponent combos survive this hero combo's removal.
+        combo_weight = weight * sum(w for w, _, _ in result.breakdown.values())
+        breakdown[''.join(hand)] = (float(weight), result.win, result.tie)
+        total_weight += combo_weight
+        win += combo_weight * result.win
+        tie += combo_weight * result.tie
+    if total_weight == 0:
+        raise ValueError("no compatible hero and opponent combos")
+    return RangeEquity(win / total_weight, tie / total_weight, breakdown)
+
+# All-in showdowns: every player's hand is evaluated on each runout and each
+# main/side pot goes to the best eligible hand, split evenly on ties.
+AllInEquity = namedtuple('AllInEquity', ['chips', 'share', 'pots', 'samples'])
+
+def side_pots(stacks, dead_money=0):
+    # Pots from all-in stacks: nobody can win more from a player than they
+    # cover, so the biggest stack only risks the second biggest. Returns
+    # (amounts, eligible) with eligible[pot, player]; dead_money (chips from
+    # players no longer in the hand) goes into the main pot.
+    stacks = np.asarray(stacks, dtype=np.float64)
+    if np.count_nonzero(stacks > 0) < 2:
+        raise ValueError("need at least two players with chips")
+    contributions = np.minimum(stacks, np.sort(stacks)[-2])
+    levels = np.unique(contributions[contributions > 0])
+    amounts = []
+    eligible = []
+    previous = 0.0
+    for level in levels:
+        amounts.append(float(np.sum(np.minimum(contributions, level) - np.minimum(contributions, previous))))
+        eligible.append(contributions >= level)
+        previous = level
+    amounts[0] += dead_money
+    return np.array(amounts), np.array(eligible, dtype=np.bool_)
+
+@njit(cache=True)
+def _award_pots(strengths, amounts, eligible, out, weight):
+    for pot in range(len(amounts)):
+        best = -1
+        winners = 0
+        for p in range(len(strengths)):
+            if eligible[pot, p]:
+                if strengths[p] > best:
+                    best = strengths[p]
+                    winners = 1
+                elif strengths[p] == best:
+                    winners += 1
+        prize = weight * amounts[pot] / winners
+        for p in range(len(strengths)):
+            if eligible[pot, p] and strengths[p] == best:
+                out[p] += prize
+
+@njit(cache=True)
+def _showdown_chunk(deck, hands, community, n_sims, amounts, eligible, state, out):
+    # hands rows of -1 are dealt at random from the deck on each runout.
+    n_players = len(hands)
+    n_known = len(community)
+    n_comm_needed = 5 - n_known
+    n_random = 0
+    for p in range(n_players):
+        if hands[p, 0] < 0:
+            n_random += 1
+    cards = np.empty(7, dtype=np.int32)
+    strengths = np.empty(n_players, dtype=np.int64)
+    for j in range(n_known):
+        cards[2 + j] = community[j]
+    for _ in range(n_sims):
+        state = _draw_cards(deck, n_comm_needed + 2 * n_random, state)
+        for j in range(n_comm_needed):
+            cards[2 + n_known + j] = deck[j]
+        drawn = n_comm_needed
+        for p in range(n_players):
+            if hands[p, 0] >= 0:
+                cards[0] = hands[p, 0]
+                cards[1] = hands[p, 1]
+            else:
+                cards[0] = deck[drawn]
+                cards[1] = deck[drawn + 1]
+                drawn += 2
+            strengths[p] = evaluate_7hand(cards)
+        _award_pots(strengths, amounts, eligible, out, 1.0)
+
+@njit(parallel=True, nogil=True, cache=True)
+def showdown_sim(hands, community, amounts, eligible, num_sims, seed=0, num_decks=1):
+    # Total chips won by each player over num_sims random runouts.
+    known = hands.ravel()
+    deck = _live_deck(known[known >= 0], community, num_decks)
+    n_chunks = (num_sims + MC_CHUNK - 1) // MC_CHUNK
+    results = np.zeros((n_chunks, len(hands)), dtype=np.float64)
+    for chunk in prange(n_chunks):
+        n_sims = min(num_sims, (chunk + 1) * MC_CHUNK) - chunk * MC_CHUNK
+        _showdown_chunk(deck.copy(), hands, community, n_sims, amounts, eligible,
+                        _stream_state(seed, chunk), results[chunk])
+    return results.sum(axis=0)
+
+@njit(parallel=True, nogil=True, cache=True)
+def showdown_enum(hands, community, runouts, weights, amounts, eligible):
+    # Exact version of showdown_sim for known hands: weighted chips won over
+    # every runout.
+    n_players = len(hands)
+    n_known = len(community)
+    n_chunks = (len(runouts) + MC_CHUNK - 1) // MC_CHUNK
+    results = np.zeros((n_chunks, n_players), dtype=np.float64)
+    for chunk in prange(n_chunks):
+        cards = np.empty(7, dtype=np.int32)
+        strengths = np.empty(n_players, dtype=np.int64)
+        for j in range(n_known):
+            cards[2 + j] = community[j]
+        for i in range(chunk * MC_CHUNK, min(len(runouts), (chunk + 1) * MC_CHUNK)):
+            for j in range(runouts.shape[1]):
+                cards[2 + n_known + j] = runouts[i, j]
+            for p in range(n_players):
+                cards[0] = hands[p, 0]
+                cards[1] = hands[p, 1]
+                strengths[p] = evaluate_7hand(cards)
+            _award_pots(strengths, amounts, eligible, results[chunk], weights[i])
+    return results.sum(axis=0)
+
+def allin_equity(hands, stacks, community_cards=None, simulations=50000, num_decks=1, seed=None, exact=None, dead_money=0):
+    # Expected chips each all-in player takes from the pots, and that as a
+    # share of everything in the middle. hands entries may be None for an
+    # unknown holding, dealt at random on each runout. With every hand known
+    # the runouts are enumerated exactly when there are no more than
+    # simulations of them (or exact=True).
+    community = list(community_cards) if community_cards else []
+    if len(hands) != len(stacks):
+        raise ValueError("need one stack per hand")
+    known = [c for hand in hands if hand is not None for c in hand]
+    if any(hand is not None and len(hand) != 2 for hand in hands):
+        raise ValueError("each known hand must have exactly 2 cards")
+    if len(community) > 5:
+        raise ValueError("too many community cards")
+    if any(v > num_decks for v in Counter(known + community).values()):
+        raise ValueError("duplicate cards exceed deck count")
+    n_random = sum(hand is None for hand in hands)
+    n_comm_needed = 5 - len(community)
+    available = 52 * num_decks - len(known) - len(community)
+    if available < n_comm_needed + 2 * n_random:
+        raise ValueError(f"need {n_comm_needed + 2 * n_random} cards but only {available} available")
+    amounts, eligible = side_pots(stacks, dead_money)
+    encoded = np.array([[card_to_index(c) for c in hand] if hand is not None else [-1, -1] for hand in hands],
+                       dtype=np.int32)
+    comm = np.array([card_to_index(c) for c in community], dtype=np.int32)
+    if exact is None:
+        exact = n_random == 0 and math.comb(available, n_comm_needed) <= simulations
+    if exact:
+        if n_random:
+            raise ValueError("exact showdowns need every hand known")
+        deck = _live_deck(encoded[encoded >= 0], comm, num_decks)
+        index = np.array(list(itertools.combinations(range(len(deck)), n_comm_needed)), dtype=np.int64)
+        runouts = deck[index.reshape(-1, n_comm_needed)] if n_comm_needed else np.zeros((1, 0), dtype=np.int32)
+        weights = np.full(len(runouts), 1.0 / len(runouts))
+        with KERNEL_LOCK:
+            chips = showdown_enum(encoded, comm, runouts, weights, amounts, eligible)
+        samples = len(runouts)
+    else:
+        if seed is None:
+            seed = random.getrandbits(63)
+        with KERNEL_LOCK:
+            chips = showdown_sim(encoded, comm, amounts, eligible, simulations, seed, num_decks) / simulations
+        samples = simulations
+    return AllInEquity(chips, chips / amounts.sum(), amounts, samples)
+
+AdaptiveOdds = namedtuple('AdaptiveOdds', ['win', 'tie', 'interval', 'samples'])
+
+def adaptive_odds(player_hand, community_cards=None, target_se=0.25, confidence=0.95, target_ci=None,
+                  time_budget_ms=None, batch_size=5000, max_simulations=1000000,
+                  num_decks=1, num_opponents=1, use_pokerkit=False, seed=None, min_batches=4, on_batch=None):
+    # Simulates in batches until the standard error of the win estimate (from
+    # batch means, in percentage points) reaches target_se, or target_ci as a
+    # half-width at the given confidence, or the time budget runs out.
+    # on_batch receives the running AdaptiveOdds and can return False to stop.
+    community = list(community_cards) if community_cards else []
+    _check_deal(player_hand, community, num_decks, num_opponents)
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    if target_ci is not None:
+        target_se = target_ci / z
+    if exact_state_count(community, num_decks) <= max_simulations:
+        win, tie = exact_equity(player_hand, community, num_decks, num_opponents)
+        return AdaptiveOdds(float(win), float(tie), (float(win), float(win)), 0)
+    if not community:
+        cached = preflop_lookup(player_hand, num_decks, num_opponents)
+        if cached is not None:
+            win, tie, _ = cached
+            se = 100 * np.sqrt(win / 100 * (1 - win / 100) / PREFLOP_TABLE[1])
+            if se <= target_se:
+                return AdaptiveOdds(win, tie, (win - z*se, win + z*se), PREFLOP_TABLE[1])
+    if seed is None:
+        seed = random.getrandbits(63)
+    started = time.perf_counter()
+    batches = []
+    while True:
+        if use_pokerkit:
+            win, tie = calculate_win_percentage(player_hand, community, batch_size, num_decks, num_opponents)
+        else:
+            win, tie, _ = simulate_equity(player_hand, community, batch_size, num_decks, num_opponents,
+                                          seed + len(batches), exact=False)
+        batches.append((win, tie))
+        samples = len(batches) * batch_size
+        wins = np.array([b[0] for b in batches])
+        se = wins.std(ddof=1) / np.sqrt(len(batches)) if len(batches) > 1 else np.inf
+        if len(batches) >= min_batches and se <= target_se:
+            break
+        if on_batch is not None:
+            win = float(wins.mean())
+            tie = float(np.mean([b[1] for b in batches]))
+            if on_batch(AdaptiveOdds(win, tie, (float(win - z*se), float(win + z*se)), samples)) is False:
+                break
+        if samples + batch_size > max_simulations:
+            break
+        if time_budget_ms is not None and (time.perf_counter() - started) * 1000 >= time_budget_ms and len(batches) > 1:
+            break
+    win = float(wins.mean())
+    tie = float(np.mean([b[1] for b in batches]))
+    return AdaptiveOdds(win, tie, (float(win - z*se), float(win + z*se)), samples)
+
+def cross_check_backends(player_hand, community_cards=None, simulations=20000, num_decks=1, num_opponents=1, seed=0):
+    # z-scores of the numba win/tie estimates against the pokerkit path. Pairwise
+    # outcomes are treated as independent, which overstates z for multiway spots.
+    random.seed(seed)
+    pk_win, pk_tie = calculate_win_percentage(player_hand, community_cards, simulations, num_decks, num_opponents)
+    nb_win, nb_tie, _ = simulate_equity(player_hand, community_cards, simulations, num_decks, num_opponents, seed, exact=False)
+    n = simulations * num_opponents
+    z_scores = []
+    for a, b in ((pk_win, nb_win), (pk_tie, nb_tie)):
+        p = (a + b) / 200
+        se = np.sqrt(max(p * (1 - p), 1e-12) * 2 / n)
+        z_scores.append(abs(a - b) / 100 / se)
+    return (pk_win, pk_tie), (nb_win, nb_tie), max(z_scores)
+
+def warmup():
+    # Compiles, or loads from the on-disk numba cache, every kernel
+    # specialisation the public entry points use, so the first live call
+    # doesn't pay for it. Returns seconds per entry point.
+    hand, flop, turn = ['As', 'Kh'], ['Qs', '7h', '2d'], ['Qs', '7h', '2d', '5c']
+    steps = (
+        ('evaluate_7hand', lambda: evaluate_7hand(np.arange(7, dtype=np.uint8))),
+        ('monte_carlo_sim', lambda: simulate_equity(hand, flop, 1000, seed=0, exact=False)),
+        ('exact_enum_sim', lambda: exact_equity(hand, turn)),
+        ('batch_monte_carlo_sim', lambda: calculate_odds_batch([hand], [flop], 100, seed=0)),
+        ('range_equity_sim', lambda: hand_vs_range(hand, 'QQ+', flop, 100, seed=0)),
+        ('showdown_sim', lambda: allin_equity([hand, None, None], [100, 200, 300], flop, 100, seed=0)),
+        ('showdown_enum', lambda: allin_equity([hand, ['Jd', 'Jc']], [100, 200], turn)),
+    )
+    timings = {}
+    for name, step in steps:
+        started = time.perf_counter()
+        step()
+        timings[name] = time.perf_counter() - started
+    return timings
+
+STARTUP_PROBE = """
+import json, time
+started = time.perf_counter()
+import oddsfinder
+imported = time.perf_counter()
+oddsfinder.warmup()
+warm = time.perf_counter()
+oddsfinder.simulate_equity(['Ah', 'Ad'], ['Kc', '9s', '4d'], 10000, seed=1, exact=False)
+done = time.perf_counter()
+print(json.dumps({'import_s': imported - started, 'warmup_s': warm - imported, 'first_call_ms': (done - warm) * 1000}))
+"""
+
+def startup_benchmark(runs=3, cold=True):
+    # Times import, warmup and the first simulation in fresh interpreters.
+    # With cold=True the runs share an empty numba cache directory, so the
+    # first run compiles everything and the rest show cached start-up.
+    import json
+    import subprocess
+    import sys
+    import tempfile
+
+    env = dict(os.environ)
+    results = []
+    with tempfile.TemporaryDirectory() as cache_dir:
+        if cold:
+            env['NUMBA_CACHE_DIR'] = cache_dir
+        for _ in range(runs):
+            started = time.perf_counter()
+            out = subprocess.run([sys.executable, '-c', STARTUP_PROBE], env=env, check=True,
+                                 capture_output=True, text=True,
+                                 cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+            result = json.loads(out.strip().splitlines()[-1])
+            result['process_s'] = time.perf_counter() - started
+            results.append(result)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Texas hold'em equity calculator")
+    commands = parser.add_subparsers(dest='command')
+    build = commands.add_parser('build-preflop', help='precompute the preflop equity table')
+    build.add_argument('--simulations', type=int, default=200000)
+    build.add_argument('--max-decks', type=int, default=2)
+    build.add_argument('--output', default=PREFLOP_TABLE_PATH)
+    commands.add_parser('warmup', help='compile and cache the numba kernels')
+    startup = commands.add_parser('startup-benchmark', help='time import, warmup and first call in fresh processes')
+    startup.add_argument('--runs', type=int, default=3)
+    startup.add_argument('--warm', action='store_true', help='use the existing numba cache for every run')
+    args = parser.parse_args()
+
+    if args.command == 'build-preflop':
+        build_preflop_table(args.output, args.simulations, args.max_decks)
+        print(f"Wrote {args.output}")
+    elif args.command == 'warmup':
+        for name, seconds in warmup().items():
+            print(f"{name}: {seconds:.3f}s")
+    elif args.command == 'startup-benchmark':
+        for i, result in enumerate(startup_benchmark(args.runs, cold=not args.warm)):
+            print(f"run {i + 1}: process {result['process_s']:.2f}s | import {result['import_s']:.2f}s | "
+                  f"warmup {result['warmup_s']:.2f}s | first call {result['first_call_ms']:.1f}ms")
+    else:
+        win, tie = calculate_odds(
+            ['As', 'Ac'],
+            ['Qh', 'Jh', 'Th'],
+            simulations=10000,
+            num_opponents=3,
+            use_pokerkit=True
+        )
+        print(f"Win: {win:.1f}% | Tie: {tie:.1f}%")
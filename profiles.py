@@ -0,0 +1,380 @@
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+MAX_HISTORY = 10  # Last 10 moves remembered per player
+MAX_BATCH_ROWS = 10000  # Rows the profile store writes per transaction at most
+STREETS = {0: 0, 3: 1, 4: 2, 5: 3}  # community card count -> preflop/flop/turn/river
+AGGRESSIVE = ('bet', 'raise', 'all-in')
+VOLUNTARY = ('call', 'bet', 'raise', 'all-in')
+
+# Integer counter columns of ProfileTable.counts. The window_* columns cover the
+# last MAX_HISTORY actions; the rest are lifetime totals.
+COUNTERS = (
+    'actions', 'hands', 'vpip', 'pfr', 'three_bet_opp', 'three_bet', 'cbet_opp', 'cbet',
+    'faced_bet_preflop', 'faced_bet_flop', 'faced_bet_turn', 'faced_bet_river',
+    'fold_to_bet_preflop', 'fold_to_bet_flop', 'fold_to_bet_turn', 'fold_to_bet_river',
+    'window_actions', 'window_aggressive', 'window_calls',
+)
+COLUMN = {name: i for i, name in enumerate(COUNTERS)}
+# Lifetime counters are persisted; the window counters follow the in-memory
+# history and start from zero each session.
+PERSISTED = COUNTERS[:COLUMN['window_actions']]
+ACTIONS, HANDS, VPIP, PFR = (COLUMN[name] for name in ('actions', 'hands', 'vpip', 'pfr'))
+THREE_BET_OPP, THREE_BET, CBET_OPP, CBET = (COLUMN[name] for name in ('three_bet_opp', 'three_bet', 'cbet_opp', 'cbet'))
+FACED_BET = COLUMN['faced_bet_preflop']
+FOLD_TO_BET = COLUMN['fold_to_bet_preflop']
+WINDOW_ACTIONS, WINDOW_AGGRESSIVE, WINDOW_CALLS = (COLUMN[name] for name in ('window_actions', 'window_aggressive', 'window_calls'))
+
+# Derived stats exported by ProfileTable.to_numpy. Window stats fall back to
+# the old fixed priors and lifetime stats to NaN until there is data.
+EXPORT_FIELDS = (
+    'aggression', 'bluff_tendency', 'call_frequency', 'vpip', 'pfr', 'three_bet', 'cbet',
+    'fold_to_bet_preflop', 'fold_to_bet_flop', 'fold_to_bet_turn', 'fold_to_bet_river',
+)
+
+def _ratio(numerator, denominator, prior):
+    return numerator / denominator if denominator else prior
+
+class PlayerProfile:
+    # View onto one row of a ProfileTable.
+    __slots__ = ('table', 'row')
+
+    def __init__(self, table, row):
+        self.table = table
+        self.row = row
+
+    def _count(self, name):
+        return int(self.table.counts[self.row, COLUMN[name]])
+
+    @property
+    def aggression(self):
+        return _ratio(self._count('window_aggressive'), self._count('window_actions'), 0.5)
+
+    @property
+    def call_frequency(self):
+        return _ratio(self._count('window_calls'), self._count('window_actions'), 0.6)
+
+    @property
+    def bluff_tendency(self):
+        return float(self.table.bluff[self.row])
+
+    @property
+    def action_history(self):
+        return self.table.histories[self.row]
+
+    @property
+    def vpip(self):
+        return _ratio(self._count('vpip'), self._count('hands'), np.nan)
+
+    @property
+    def pfr(self):
+        return _ratio(self._count('pfr'), self._count('hands'), np.nan)
+
+    @property
+    def three_bet(self):
+        return _ratio(self._count('three_bet'), self._count('three_bet_opp'), np.nan)
+
+    @property
+    def cbet(self):
+        return _ratio(self._count('cbet'), self._count('cbet_opp'), np.nan)
+
+    @property
+    def fold_to_bet(self):
+        counts = self.table.counts[self.row]
+        return tuple(_ratio(int(counts[FOLD_TO_BET + s]), int(counts[FACED_BET + s]), np.nan) for s in range(4))
+
+class ProfileTable:
+    # Opponent profiles as rows of one counter array, updated in O(1) per
+    # action. Hand context (who raised preflop, whether a bet is pending on
+    # this street) is tracked here, so callers only report actions.
+    # With a ProfileStore, a player's lifetime counters are read from it the
+    # first time they are seen, and the changes since the last flush are
+    # handed to it at every hand boundary.
+    def __init__(self, capacity=64, store=None):
+        self.index = {}
+        self.ids = []
+        self.counts = np.zeros((capacity, len(COUNTERS)), dtype=np.int32)
+        self.flushed = np.zeros((capacity, len(PERSISTED)), dtype=np.int32)
+        self.bluff = np.full(capacity, 0.2, dtype=np.float64)
+        self.histories = []
+        self.dirty = set()
+        self.store = store
+        self.begin_hand()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['store'] = None
+        return state
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, player_id):
+        return player_id in self.index
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __getitem__(self, player_id):
+        return PlayerProfile(self, self._row(player_id))
+
+    def keys(self):
+        return list(self.ids)
+
+    def values(self):
+        return [PlayerProfile(self, row) for row in range(len(self.ids))]
+
+    def items(self):
+        return [(pid, PlayerProfile(self, row)) for row, pid in enumerate(self.ids)]
+
+    def _row(self, player_id):
+        row = self.index.get(player_id)
+        if row is None:
+            row = len(self.ids)
+            if row == len(self.counts):
+                self.counts = np.concatenate((self.counts, np.zeros_like(self.counts)))
+                self.flushed = np.concatenate((self.flushed, np.zeros_like(self.flushed)))
+                self.bluff = np.concatenate((self.bluff, np.full(len(self.bluff), 0.2)))
+            self.index[player_id] = row
+            self.ids.append(player_id)
+            self.histories.append(deque(maxlen=MAX_HISTORY))
+            saved = self.store.load(player_id) if self.store is not None else None
+            if saved is not None:
+                self.counts[row, :len(PERSISTED)] = saved[0]
+                self.flushed[row] = saved[0]
+                self.bluff[row] = saved[1]
+        return row
+
+    def merge(self, other):
+        # Adds another table's lifetime counters into this one, e.g. from
+        # replay workers. Players new to this table also take the other's
+        # recent history and bluff estimate.
+        n = len(PERSISTED)
+        for row, player_id in enumerate(other.ids):
+            new = player_id not in self.index
+            target = self._row(player_id)
+            self.counts[target, :n] += other.counts[row, :n]
+            if new:
+                self.counts[target, n:] = other.counts[row, n:]
+                self.histories[target].extend(other.histories[row])
+                self.bluff[target] = other.bluff[row]
+            self.dirty.add(target)
+
+    def flush(self):
+        # Hands the counter deltas of every row changed since the last flush
+        # to the store. Only copies in memory; the store writes in the
+        # background.
+        if self.store is None or not self.dirty:
+            return
+        rows = sorted(self.dirty)
+        self.dirty = set()
+        current = self.counts[rows, :len(PERSISTED)]
+        deltas = current - self.flushed[rows]
+        self.flushed[rows] = current
+        self.store.submit([(self.ids[row], deltas[i].tolist(), float(self.bluff[row]))
+                           for i, row in enumerate(rows)])
+
+    def begin_hand(self):
+        self.flush()
+        self.seen = set()
+        self.voluntary = set()
+        self.raised = set()
+        self.three_bet_seen = set()
+        self.preflop_raises = 0
+        self.preflop_aggressor = None
+        self.begin_street(0)
+
+    def begin_street(self, stage):
+        self.street = STREETS.get(stage, 3)
+        # Preflop the blinds count as the bet to face.
+        self.bet_pending = self.street == 0
+        self.cbet_checked = False
+
+    def record(self, player_id, action, amount=0):
+        row = self._row(player_id)
+        # Element access through a memoryview is several times cheaper than
+        # numpy scalar indexing, and this runs once per action.
+        cells = memoryview(self.counts)
+        aggressive = action in AGGRESSIVE
+        self.dirty.add(row)
+        cells[row, ACTIONS] += 1
+        if player_id not in self.seen:
+            self.seen.add(player_id)
+            cells[row, HANDS] += 1
+
+        if self.street == 0:
+            if action in VOLUNTARY and player_id not in self.voluntary:
+                self.voluntary.add(player_id)
+                cells[row, VPIP] += 1
+            if self.preflop_raises == 1 and player_id not in self.raised and player_id not in self.three_bet_seen:
+                self.three_bet_seen.add(player_id)
+                cells[row, THREE_BET_OPP] += 1
+                if aggressive:
+                    cells[row, THREE_BET] += 1
+            if aggressive:
+                if player_id not in self.raised:
+                    self.raised.add(player_id)
+                    cells[row, PFR] += 1
+                self.preflop_raises += 1
+                self.preflop_aggressor = player_id
+        elif self.street == 1 and player_id == self.preflop_aggressor and not self.bet_pending and not self.cbet_checked:
+            self.cbet_checked = True
+            cells[row, CBET_OPP] += 1
+            if aggressive:
+                cells[row, CBET] += 1
+
+        if self.bet_pending:
+            cells[row, FACED_BET + self.street] += 1
+            if action == 'fold':
+                cells[row, FOLD_TO_BET + self.street] += 1
+        if aggressive:
+            self.bet_pending = True
+
+        history = self.histories[row]
+        if len(history) == history.maxlen:
+            leaving = history[0]['action']
+            cells[row, WINDOW_AGGRESSIVE] += aggressive - (leaving in AGGRESSIVE)
+            cells[row, WINDOW_CALLS] += (action == 'call') - (leaving == 'call')
+        else:
+            cells[row, WINDOW_ACTIONS] += 1
+            cells[row, WINDOW_AGGRESSIVE] += aggressive
+            cells[row, WINDOW_CALLS] += action == 'call'
+        history.append({'action': action, 'amount': amount})
+
+        if action == 'bluff':
+            self.bluff[row] = 0.9 * self.bluff[row] + 0.1
+        else:
+            self.bluff[row] *= 0.95
+
+    def to_numpy(self):
+        # One record per player: 'player' plus the derived EXPORT_FIELDS.
+        n = len(self.ids)
+        counts = self.counts[:n].astype(np.float64)
+        dtype = [('player', 'U64')] + [(name, 'f8') for name in EXPORT_FIELDS]
+        out = np.zeros(n, dtype=dtype)
+        out['player'] = self.ids
+
+        def ratio(numerator, denominator, prior):
+            with np.errstate(divide='ignore', invalid='ignore'):
+                return np.where(denominator > 0, numerator / denominator, prior)
+
+        col = lambda name: counts[:, COLUMN[name]]
+        out['aggression'] = ratio(col('window_aggressive'), col('window_actions'), 0.5)
+        out['bluff_tendency'] = self.bluff[:n]
+        out['call_frequency'] = ratio(col('window_calls'), col('window_actions'), 0.6)
+        out['vpip'] = ratio(col('vpip'), col('hands'), np.nan)
+        out['pfr'] = ratio(col('pfr'), col('hands'), np.nan)
+        out['three_bet'] = ratio(col('three_bet'), col('three_bet_opp'), np.nan)
+        out['cbet'] = ratio(col('cbet'), col('cbet_opp'), np.nan)
+        for s, street in enumerate(('preflop', 'flop', 'turn', 'river')):
+            out[f'fold_to_bet_{street}'] = ratio(counts[:, FOLD_TO_BET + s], counts[:, FACED_BET + s], np.nan)
+        return out
+
+class ProfileStore:
+    # Lifetime profile counters in SQLite, one fixed-width row per player.
+    # Reads are single-row lookups on first sight of a player, so opening a
+    # store costs the same whatever its size. Writes are counter deltas
+    # queued by ProfileTable.flush and applied in batches by a writer thread;
+    # because they are added rather than overwritten, several tables or
+    # processes can share one file. WAL mode lets readers run alongside the
+    # writer.
+    def __init__(self, path, flush_interval=1.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue()
+        self.local = threading.local()
+        self.writer = None
+        self.lock = threading.Lock()
+        self.batches = 0
+        self.rows_written = 0
+        self.rows_dropped = 0
+        columns = ', '.join(f'{name} INTEGER NOT NULL DEFAULT 0' for name in PERSISTED)
+        conn = self._connection()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(f'CREATE TABLE IF NOT EXISTS profiles (player TEXT PRIMARY KEY, {columns}, '
+                     'bluff REAL NOT NULL DEFAULT 0.2)')
+        conn.commit()
+        names = ', '.join(PERSISTED)
+        self.select_sql = f'SELECT {names}, bluff FROM profiles WHERE player = ?'
+        self.upsert_sql = (
+            f'INSERT INTO profiles (player, {names}, bluff) VALUES ({", ".join("?" * (len(PERSISTED) + 2))}) '
+            f'ON CONFLICT(player) DO UPDATE SET '
+            + ', '.join(f'{name} = {name} + excluded.{name}' for name in PERSISTED)
+            + ', bluff = excluded.bluff'
+        )
+
+    def _connection(self):
+        # sqlite3 connections can't be shared between threads.
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self.local.conn = conn
+        return conn
+
+    def load(self, player_id):
+        # Returns (lifetime counters, bluff) or None for an unknown player.
+        # Deltas still queued for writing are not included.
+        row = self._connection().execute(self.select_sql, (str(player_id),)).fetchone()
+        if row is None:
+            return None
+        return np.array(row[:-1], dtype=np.int32), row[-1]
+
+    def submit(self, rows):
+        # rows: (player_id, counter deltas, bluff). Never blocks on disk.
+        with self.lock:
+            if self.writer is None:
+                self.writer = threading.Thread(target=self._run, name='profile-store', daemon=True)
+                self.writer.start()
+        self.queue.put(rows)
+
+    def _run(self):
+        conn = self._connection()
+        stop = False
+        while not stop:
+            batches = [self.queue.get()]
+            rows = len(batches[0] or ())
+            # Gather whatever else arrives within flush_interval of the first
+            # batch, so steady play still commits every interval.
+            deadline = time.monotonic() + self.flush_interval
+            try:
+                while batches[-1] is not None and rows < MAX_BATCH_ROWS:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    batches.append(self.queue.get(timeout=remaining))
+                    rows += len(batches[-1] or ())
+            except queue.Empty:
+                pass
+            stop = batches[-1] is None
+            params = [(str(pid), *deltas, bluff) for batch in batches if batch for pid, deltas, bluff in batch]
+            if params:
+                # A failed batch (e.g. "database is locked" past the timeout)
+                # is dropped and reported; the writer keeps draining so later
+                # deltas still land and flush() returns.
+                try:
+                    with conn:
+                        conn.executemany(self.upsert_sql, params)
+                    self.batches += 1
+                    self.rows_written += len(params)
+                except sqlite3.Error as e:
+                    self.rows_dropped += len(params)
+                    print(f"Error writing {len(params)} profile rows: {e}")
+            for _ in batches:
+                self.queue.task_done()
+
+    def flush(self):
+        # Blocks until every submitted batch is on disk.
+        self.queue.join()
+
+    def close(self):
+        with self.lock:
+            writer, self.writer = self.writer, None
+        if writer is not None:
+            self.queue.put(None)
+            writer.join()
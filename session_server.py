@@ -0,0 +1,238 @@
+import argparse
+import asyncio
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from aiohttp import web
+
+import hand_analyzer
+import instrumentation
+import mainbluffer
+import oddsfinder
+
+MAX_TABLES = 256
+MAX_PENDING_DECISIONS = 64  # Decisions queued or running before new ones are refused
+DECISION_WORKERS = 8  # Threads that wait on equity results for decisions
+LATENCY_WINDOW = 1000  # Latencies kept per table and request type
+CACHE_SAVE_INTERVAL = 300  # Seconds between saves of a persistent decision cache
+
+class TableSession:
+    def __init__(self, tracker):
+        self.tracker = tracker
+        # Events for one table are applied in the order they arrive.
+        self.lock = asyncio.Lock()
+        self.latencies = {}
+        self.last_used = time.monotonic()
+
+    def observe(self, op, seconds):
+        self.latencies.setdefault(op, deque(maxlen=LATENCY_WINDOW)).append(seconds)
+        self.last_used = time.monotonic()
+
+    def metrics(self):
+        out = {}
+        for op, samples in self.latencies.items():
+            ms = np.array(samples) * 1000
+            out[op] = {
+                'count': len(ms),
+                'mean_ms': float(ms.mean()),
+                'p50_ms': float(np.percentile(ms, 50)),
+                'p95_ms': float(np.percentile(ms, 95)),
+                'max_ms': float(ms.max()),
+            }
+        return out
+
+class SessionServer:
+    # Hosts many tables in one process. Every table shares the equity worker
+    # pool, the evaluator tables loaded by oddsfinder, the LLM client and the
+    # profile store; each gets its own GameStateTracker.
+    def __init__(self, max_tables=MAX_TABLES, max_pending=MAX_PENDING_DECISIONS, decision_workers=DECISION_WORKERS):
+        self.max_tables = max_tables
+        self.max_pending = max_pending
+        self.tables = {}
+        self.pending = 0
+        self.rejected = 0
+        self.executor = ThreadPoolExecutor(max_workers=decision_workers, thread_name_prefix='decision')
+        self.equity_pool = mainbluffer.equity_pool()
+        self.decision_client = mainbluffer.decision_client()
+        self.profile_store = mainbluffer.profile_store()
+        self.event_log = mainbluffer.event_log()
+
+    def app(self):
+        app = web.Application()
+        app.add_routes([
+            web.post('/tables/{table}/hand', self.new_hand),
+            web.post('/tables/{table}/board', self.update_board),
+            web.post('/tables/{table}/action', self.record_action),
+            web.post('/tables/{table}/decision', self.decision),
+            web.delete('/tables/{table}', self.close_table),
+            web.get('/tables', self.list_tables),
+            web.get('/metrics', self.metrics),
+            web.get('/metrics/prometheus', self.prometheus),
+            web.post('/profile', self.arm_profiler),
+            web.get('/profiles', self.profiles),
+        ])
+        app.on_startup.append(self._startup)
+        app.on_cleanup.append(self._cleanup)
+        return app
+
+    async def _startup(self, app):
+        # Compile the simulation and hand analysis kernels once, before the
+        # first table needs them.
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, oddsfinder.warmup)
+        await loop.run_in_executor(self.executor, hand_analyzer.warmup)
+        cache = self.decision_client.cache
+        if cache is not None and cache.path is not None:
+            app['cache_saver'] = asyncio.ensure_future(self._save_cache_periodically(cache))
+
+    async def _save_cache_periodically(self, cache):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(CACHE_SAVE_INTERVAL)
+            await loop.run_in_executor(self.executor, cache.save)
+
+    async def _cleanup(self, app):
+        if 'cache_saver' in app:
+            app['cache_saver'].cancel()
+        for table_id in list(self.tables):
+            self._drop(table_id)
+        cache = self.decision_client.cache
+        if cache is not None and cache.path is not None:
+            cache.save()
+        await self.decision_client.close()
+        if self.profile_store is not None:
+            self.profile_store.close()
+        if self.event_log is not None:
+            self.event_log.close()
+        mainbluffer.shutdown_equity_pool()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _session(self, request, create=False):
+        table_id = request.match_info['table']
+        session = self.tables.get(table_id)
+        if session is None:
+            if not create:
+                raise web.HTTPNotFound(text=f"unknown table {table_id!r}")
+            if len(self.tables) >= self.max_tables:
+                self._evict_idle()
+            analyzers = mainbluffer.PokerAIAnalyzer(self.equity_pool, self.decision_client, self.profile_store)
+            session = self.tables[table_id] = TableSession(mainbluffer.GameStateTracker(analyzers, table=table_id))
+        return session
+
+    def _evict_idle(self):
+        table_id = min(self.tables, key=lambda t: self.tables[t].last_used)
+        if self.tables[table_id].lock.locked():
+            raise web.HTTPServiceUnavailable(text='too many tables', headers={'Retry-After': '1'})
+        self._drop(table_id)
+
+    def _drop(self, table_id):
+        session = self.tables.pop(table_id, None)
+        if session is None:
+            return False
+        analyzers = session.tracker.analyzers
+        if analyzers.equity_job is not None:
+            analyzers.equity_job.cancel()
+        analyzers.player_profiles.flush()
+        return True
+
+    async def _body(self, request, *keys):
+        try:
+            body = await request.json()
+            return body, [body[key] for key in keys]
+        except (ValueError, KeyError, TypeError) as e:
+            raise web.HTTPBadRequest(text=f"expected a JSON object with {', '.join(keys)}: {e}")
+
+    async def new_hand(self, request):
+        start = time.perf_counter()
+        body, (hand, players) = await self._body(request, 'hand', 'players')
+        session = self._session(request, create=True)
+        async with session.lock:
+            if 'blinds' in body:
+                session.tracker.analyzers.blind_structure = tuple(body['blinds'])
+            session.tracker.new_hand(list(hand), dict(players))
+        session.observe('hand', time.perf_counter() - start)
+        return web.json_response({'pot': session.tracker.analyzers.current_pot})
+
+    async def update_board(self, request):
+        start = time.perf_counter()
+        _, (cards,) = await self._body(request, 'cards')
+        session = self._session(request)
+        async with session.lock:
+            session.tracker.update_board(list(cards))
+        session.observe('board', time.perf_counter() - start)
+        return web.json_response({'board': session.tracker.community_cards})
+
+    async def record_action(self, request):
+        start = time.perf_counter()
+        body, (player, action_type) = await self._body(request, 'player', 'type')
+        session = self._session(request)
+        async with session.lock:
+            session.tracker.record_action(player, {'type': action_type, 'amount': body.get('amount', 0)})
+        session.observe('action', time.perf_counter() - start)
+        return web.json_response({'pot': session.tracker.analyzers.current_pot, 'to_call': session.tracker.to_call()})
+
+    async def decision(self, request):
+        start = time.perf_counter()
+        session = self._session(request)
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise web.HTTPServiceUnavailable(text='decision queue full', headers={'Retry-After': '1'})
+        self.pending += 1
+        try:
+            async with session.lock:
+                decision = await session.tracker.get_ai_decision_async(self.executor)
+        finally:
+            self.pending -= 1
+        elapsed = time.perf_counter() - start
+        session.observe('decision', elapsed)
+        return web.json_response(dict(decision, latency_ms=elapsed * 1000))
+
+    async def close_table(self, request):
+        if not self._drop(request.match_info['table']):
+            raise web.HTTPNotFound(text=f"unknown table {request.match_info['table']!r}")
+        return web.json_response({'closed': request.match_info['table']})
+
+    async def list_tables(self, request):
+        return web.json_response(sorted(self.tables))
+
+    async def metrics(self, request):
+        return web.json_response({
+            'tables': {table_id: session.metrics() for table_id, session in self.tables.items()},
+            'pending_decisions': self.pending,
+            'rejected_decisions': self.rejected,
+            'decision_client': dict(self.decision_client.stats),
+            'fast_path': {table_id: session.tracker.analyzers.policy.stats() for table_id, session in self.tables.items()},
+            'stages': instrumentation.snapshot(),
+        })
+
+    async def prometheus(self, request):
+        return web.Response(text=instrumentation.prometheus_text(), content_type='text/plain')
+
+    async def arm_profiler(self, request):
+        # Samples the next ?count= decisions; read them back from /profiles.
+        count = int(request.query.get('count', 1))
+        instrumentation.profile_next(count)
+        return web.json_response({'armed': count})
+
+    async def profiles(self, request):
+        return web.json_response([
+            {'label': label, 'seconds': seconds, 'samples': profiler.samples, 'collapsed': profiler.collapsed()}
+            for label, seconds, profiler in instrumentation.PROFILES
+        ])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Serve many poker tables from one process')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', default=None, help='listen on this unix socket instead of TCP')
+    parser.add_argument('--max-tables', type=int, default=MAX_TABLES)
+    parser.add_argument('--max-pending', type=int, default=MAX_PENDING_DECISIONS)
+    args = parser.parse_args()
+
+    server = SessionServer(args.max_tables, args.max_pending)
+    if args.unix:
+        web.run_app(server.app(), path=args.unix)
+    else:
+        web.run_app(server.app(), host=args.host, port=args.port)
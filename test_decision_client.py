@@ -0,0 +1,96 @@
+import asyncio
+import json
+import threading
+
+import pytest
+from aiohttp import web
+
+from decision_client import DecisionCache, DecisionClient
+from mainbluffer import PokerAIAnalyzer
+
+DECISION = {'action': 'raise', 'amount': 300, 'confidence': 70}
+
+class StubServer:
+    # Local stand-in for the chat completions endpoint. Modes: 'ok' answers
+    # DECISION, '503' always fails, 'flaky' fails every other request,
+    # 'slow' answers after 5 seconds and 'garbled' answers a non-numeric
+    # amount.
+    def __init__(self, mode):
+        self.mode = mode
+        self.requests = 0
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.runner, self.url = asyncio.run_coroutine_threadsafe(self._start(), self.loop).result()
+
+    async def _handle(self, request):
+        self.requests += 1
+        await request.json()
+        if self.mode == '503' or (self.mode == 'flaky' and self.requests % 2 == 1):
+            return web.Response(status=503)
+        if self.mode == 'slow':
+            await asyncio.sleep(5)
+        decision = dict(DECISION, amount='pot') if self.mode == 'garbled' else DECISION
+        return web.json_response({'choices': [{'message': {'content': json.dumps(decision)}}]})
+
+    async def _start(self):
+        app = web.Application()
+        app.router.add_post('/v1/chat', self._handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return runner, f'http://127.0.0.1:{port}/v1/chat'
+
+    def close(self):
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+@pytest.fixture
+def stub(request):
+    server = StubServer(request.param)
+    yield server
+    server.close()
+
+def _client(url, **kwargs):
+    return DecisionClient('test-key', 'test-model', url=url, backoff=0.01, **kwargs)
+
+@pytest.mark.parametrize('stub', ['ok'], indirect=True)
+def test_answer_and_cache(stub):
+    client = _client(stub.url, cache=DecisionCache())
+    assert client.decide_blocking('prompt', 2.0, cache_key=('spot',)) == DECISION
+    assert client.decide_blocking('prompt', 2.0, cache_key=('spot',)) == DECISION
+    assert stub.requests == 1
+    assert client.cache.stats()['hits'] == 1
+
+@pytest.mark.parametrize('stub', ['flaky'], indirect=True)
+def test_retries_after_503(stub):
+    client = _client(stub.url)
+    assert client.decide_blocking('prompt', 2.0) == DECISION
+    assert client.stats['retries'] == 1
+
+@pytest.mark.parametrize('stub', ['503'], indirect=True)
+def test_gives_up_with_fallback(stub):
+    client = _client(stub.url, retries=2, cache=DecisionCache())
+    decision = client.decide_blocking('prompt', 2.0, {'action': 'fold', 'confidence': 40}, cache_key=('spot',))
+    assert decision == {'action': 'fold', 'confidence': 40, 'fallback': True}
+    assert stub.requests == 3
+    # Fallbacks are not cached.
+    assert client.cache.stats()['size'] == 0
+
+@pytest.mark.parametrize('stub', ['garbled'], indirect=True)
+def test_non_numeric_fields_are_malformed(stub):
+    client = _client(stub.url, retries=1)
+    decision = client.decide_blocking('prompt', 2.0, {'action': 'fold', 'confidence': 40})
+    assert decision['fallback'] and client.stats['errors'] == 2
+
+@pytest.mark.parametrize('stub', ['slow'], indirect=True)
+def test_budget_expiry_respects_the_bet_faced(stub):
+    analyzers = PokerAIAnalyzer(decision_client=_client(stub.url))
+    analyzers.current_pot = 1050
+    decision = analyzers.ai_decision('prompt', win_prob=0.3, budget=0.2, to_call=900)
+    assert decision['action'] == 'fold' and decision['fallback']
+    decision = analyzers.ai_decision('prompt', win_prob=0.5, budget=0.2, to_call=900)
+    assert decision == {'action': 'call', 'amount': 900, 'confidence': 50, 'fallback': True}
@@ -0,0 +1,34 @@
+import os
+
+import pytest
+
+import oddsfinder
+
+def test_evaluate_7hand_matches_reference():
+    # Sampled 7-card hands against the 21-combination tuple oracle.
+    assert oddsfinder.verify_evaluator(samples=2000, seed=1) == []
+
+def test_evaluate_7hand_matches_best_of_21():
+    # Enough hands that straight flushes and quads turn up hundreds of times.
+    assert oddsfinder.count_evaluator_mismatches(samples=3000000, seed=1) == 0
+
+def test_evaluate_7hand_two_decks():
+    # Shoes repeat cards: a suit can hold five or more cards with fewer
+    # distinct ranks, and the best flush can use both copies of a card.
+    assert oddsfinder.verify_evaluator(samples=5000, seed=2, num_decks=2) == []
+
+def test_evaluate_5card_matches_reference():
+    assert oddsfinder.verify_evaluate_5card(samples=20000, seed=1) == []
+
+@pytest.mark.skipif(not os.environ.get('POKERGPT_SLOW_TESTS'), reason='set POKERGPT_SLOW_TESTS=1 (takes minutes)')
+def test_evaluate_5card_exhaustive():
+    # All 2,598,960 five-card hands.
+    assert oddsfinder.verify_evaluate_5card() == []
+
+def test_backends_agree():
+    pokerkit = pytest.importorskip('pokerkit')
+    if not hasattr(pokerkit, 'HandUtilities'):
+        pytest.skip('installed pokerkit has no HandUtilities')
+    for hand, board, opponents in ((['As', 'Kh'], ['Qs', '7h', '2d'], 1), (['9c', '9d'], [], 2)):
+        _, _, z = oddsfinder.cross_check_backends(hand, board, simulations=3000, num_opponents=opponents, seed=3)
+        assert z < 4